@@ -17,8 +17,7 @@ cargo build --release
 BINARY="./target/release/mermaid-ascii"
 
 # Remove old generated files
-find _site/examples -name '*.out.txt' -delete 2>/dev/null || true
-find _site/examples -name '*.out.svg' -delete 2>/dev/null || true
+find _site/examples \( -name '*.out.txt' -o -name '*.out.svg' \) -delete 2>/dev/null || true
 
 # Process all .mm.md files recursively
 find _site/examples -name '*.mm.md' | sort | while read -r src; do
@@ -32,7 +31,7 @@ done
 
 echo ""
 echo "Done. Generated output:"
-find _site/examples -name '*.out.txt' -o -name '*.out.svg' | sort | while read -r f; do
+find _site/examples \( -name '*.out.txt' -o -name '*.out.svg' \) | sort | while read -r f; do
     echo "  $f"
 done
 
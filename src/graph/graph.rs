@@ -8,9 +8,9 @@
 //
 // Wraps petgraph::graph::DiGraph internally.
 
-use std::collections::HashMap;
+use std::collections::{HashMap, VecDeque};
 
-use petgraph::algo::{is_cyclic_directed, toposort};
+use petgraph::Direction;
 use petgraph::graph::{DiGraph as PetGraph, NodeIndex};
 
 // ── Data types ────────────────────────────────────────────────────────────────
@@ -44,6 +44,10 @@ pub struct Graph {
     pub digraph: PetGraph<NodeData, EdgeData>,
     /// Maps node id → petgraph NodeIndex.
     pub node_index: HashMap<String, NodeIndex>,
+    /// True while every edge added through graph_add_edge points from a
+    /// lower to a higher node index. Insertion order is then a topological
+    /// order, which lets graph_is_dag answer without a traversal.
+    pub forward_edges_only: bool,
 }
 
 /// Manual PartialEq for Graph — compares node_index maps only (used by
@@ -61,30 +65,17 @@ pub fn graph_new() -> Graph {
     Graph {
         digraph: PetGraph::new(),
         node_index: HashMap::new(),
+        forward_edges_only: true,
     }
 }
 
 // ── Mutation ─────────────────────────────────────────────────────────────────
 
 /// Add a node. No-op if a node with the same `id` already exists.
-pub fn graph_add_node(
-    g: &mut Graph,
-    id: &str,
-    label: &str,
-    shape: &str,
-    subgraph: Option<&str>,
-) {
-    if g.node_index.contains_key(id) {
-        return;
+pub fn graph_add_node(g: &mut Graph, id: &str, label: &str, shape: &str, subgraph: Option<&str>) {
+    if !g.node_index.contains_key(id) {
+        insert_node(g, id, label, shape, subgraph);
     }
-    let data = NodeData {
-        id: id.to_string(),
-        label: label.to_string(),
-        shape: shape.to_string(),
-        subgraph: subgraph.map(|s| s.to_string()),
-    };
-    let idx = g.digraph.add_node(data);
-    g.node_index.insert(id.to_string(), idx);
 }
 
 /// Add a directed edge from `from_id` to `to_id`.
@@ -98,10 +89,9 @@ pub fn graph_add_edge(
     edge_type: &str,
     label: Option<&str>,
 ) {
-    graph_ensure_node(g, from_id);
-    graph_ensure_node(g, to_id);
-    let from_idx = g.node_index[from_id];
-    let to_idx = g.node_index[to_id];
+    let from_idx = ensure_index(g, from_id);
+    let to_idx = ensure_index(g, to_id);
+    g.forward_edges_only &= from_idx < to_idx;
     let data = EdgeData {
         edge_type: edge_type.to_string(),
         label: label.map(|l| l.to_string()),
@@ -114,11 +104,37 @@ pub fn graph_add_edge(
 /// Exposed as `pub` for higher-level builder code (e.g., layout phases that
 /// need to materialise implicit nodes referenced only in edges).
 pub fn graph_ensure_node(g: &mut Graph, id: &str) {
-    if !g.node_index.contains_key(id) {
-        graph_add_node(g, id, id, "Rectangle", None);
+    ensure_index(g, id);
+}
+
+/// Index of `id`, creating a Rectangle placeholder if absent. One map probe
+/// on the hit path, so edge insertion does not re-check what it just added.
+fn ensure_index(g: &mut Graph, id: &str) -> NodeIndex {
+    match g.node_index.get(id) {
+        Some(&idx) => idx,
+        None => insert_node(g, id, id, "Rectangle", None),
     }
 }
 
+/// Append a node known to be absent and record its index.
+fn insert_node(
+    g: &mut Graph,
+    id: &str,
+    label: &str,
+    shape: &str,
+    subgraph: Option<&str>,
+) -> NodeIndex {
+    let data = NodeData {
+        id: id.to_string(),
+        label: label.to_string(),
+        shape: shape.to_string(),
+        subgraph: subgraph.map(|s| s.to_string()),
+    };
+    let idx = g.digraph.add_node(data);
+    g.node_index.insert(id.to_string(), idx);
+    idx
+}
+
 // ── Topology queries ─────────────────────────────────────────────────────────
 
 /// Return the sorted list of successor (outgoing-neighbour) ids for `id`.
@@ -219,8 +235,42 @@ pub fn graph_edge_count(g: &Graph) -> usize {
 // ── DAG algorithms ───────────────────────────────────────────────────────────
 
 /// Returns `true` if the graph contains no directed cycles (i.e., is a DAG).
+///
+/// Iterative three-colour DFS that stops at the first back edge (a
+/// self-loop counts as one), so no ordering is built just to be discarded.
+/// Graphs whose edges all run forward in insertion order skip the walk.
 pub fn graph_is_dag(g: &Graph) -> bool {
-    !is_cyclic_directed(&g.digraph)
+    if g.forward_edges_only {
+        return true;
+    }
+    // 0 = unvisited, 1 = on the DFS stack, 2 = finished.
+    let mut color = vec![0u8; g.digraph.node_count()];
+    let mut stack = Vec::new();
+    for root in g.digraph.node_indices() {
+        if color[root.index()] != 0 {
+            continue;
+        }
+        color[root.index()] = 1;
+        stack.push((root, g.digraph.neighbors(root)));
+        while let Some((u, succs)) = stack.last_mut() {
+            let u = *u;
+            match succs.next() {
+                Some(v) => match color[v.index()] {
+                    0 => {
+                        color[v.index()] = 1;
+                        stack.push((v, g.digraph.neighbors(v)));
+                    }
+                    1 => return false,
+                    _ => {}
+                },
+                None => {
+                    color[u.index()] = 2;
+                    stack.pop();
+                }
+            }
+        }
+    }
+    true
 }
 
 /// Returns a topological ordering of node ids, or `None` if the graph has cycles.
@@ -228,16 +278,47 @@ pub fn graph_is_dag(g: &Graph) -> bool {
 /// The order respects all directed edges: if there is an edge A→B then A
 /// appears before B in the returned list.
 pub fn graph_topo_sort(g: &Graph) -> Option<Vec<String>> {
-    match toposort(&g.digraph, None) {
-        Ok(indices) => {
-            let ids = indices
-                .into_iter()
-                .map(|idx| g.digraph[idx].id.clone())
-                .collect();
-            Some(ids)
+    let order = kahn_order(g)?;
+    Some(
+        order
+            .into_iter()
+            .map(|idx| g.digraph[idx].id.clone())
+            .collect(),
+    )
+}
+
+/// Kahn's algorithm over node indices with a flat in-degree array.
+///
+/// Sources are seeded in insertion order. Returns `None` when a cycle keeps
+/// some nodes from ever reaching in-degree zero.
+fn kahn_order(g: &Graph) -> Option<Vec<NodeIndex>> {
+    let n = g.digraph.node_count();
+    let mut indeg: Vec<usize> = g
+        .digraph
+        .node_indices()
+        .map(|idx| {
+            g.digraph
+                .neighbors_directed(idx, Direction::Incoming)
+                .count()
+        })
+        .collect();
+    let mut queue: VecDeque<NodeIndex> = g
+        .digraph
+        .node_indices()
+        .filter(|idx| indeg[idx.index()] == 0)
+        .collect();
+    let mut order = Vec::with_capacity(n);
+    while let Some(u) = queue.pop_front() {
+        order.push(u);
+        for v in g.digraph.neighbors(u) {
+            let d = &mut indeg[v.index()];
+            *d -= 1;
+            if *d == 0 {
+                queue.push_back(v);
+            }
         }
-        Err(_) => None,
     }
+    (order.len() == n).then_some(order)
 }
 
 // ── Utility ───────────────────────────────────────────────────────────────────
@@ -362,6 +443,38 @@ mod tests {
         assert!(!graph_is_dag(&g));
     }
 
+    #[test]
+    fn test_is_dag_self_loop_and_shared_descendant() {
+        let mut g = graph_new();
+        // Two paths into D must not be mistaken for a cycle.
+        graph_add_edge(&mut g, "A", "B", "Arrow", None);
+        graph_add_edge(&mut g, "A", "C", "Arrow", None);
+        graph_add_edge(&mut g, "B", "D", "Arrow", None);
+        graph_add_edge(&mut g, "C", "D", "Arrow", None);
+        assert!(graph_is_dag(&g));
+
+        graph_add_edge(&mut g, "C", "C", "Arrow", None);
+        assert!(!graph_is_dag(&g));
+    }
+
+    #[test]
+    fn test_forward_edges_only_flag() {
+        let mut g = graph_new();
+        graph_add_edge(&mut g, "A", "B", "Arrow", None);
+        graph_add_edge(&mut g, "B", "C", "Arrow", None);
+        assert!(g.forward_edges_only);
+        assert!(graph_is_dag(&g));
+
+        // A backward edge clears the flag without implying a cycle.
+        graph_add_node(&mut g, "D", "D", "Rectangle", None);
+        graph_add_edge(&mut g, "D", "A", "Arrow", None);
+        assert!(!g.forward_edges_only);
+        assert!(graph_is_dag(&g));
+
+        graph_add_edge(&mut g, "C", "A", "Arrow", None);
+        assert!(!graph_is_dag(&g));
+    }
+
     #[test]
     fn test_topo_sort_chain() {
         let mut g = graph_new();
@@ -384,6 +497,21 @@ mod tests {
         assert!(graph_topo_sort(&g).is_none());
     }
 
+    #[test]
+    fn test_topo_sort_diamond_and_self_loop() {
+        let mut g = graph_new();
+        graph_add_edge(&mut g, "A", "B", "Arrow", None);
+        graph_add_edge(&mut g, "A", "C", "Arrow", None);
+        graph_add_edge(&mut g, "B", "D", "Arrow", None);
+        graph_add_edge(&mut g, "C", "D", "Arrow", None);
+        let order = graph_topo_sort(&g).unwrap();
+        assert_eq!(order.first().map(String::as_str), Some("A"));
+        assert_eq!(order.last().map(String::as_str), Some("D"));
+
+        graph_add_edge(&mut g, "D", "D", "Arrow", None);
+        assert!(graph_topo_sort(&g).is_none());
+    }
+
     #[test]
     fn test_graph_copy_is_independent() {
         let mut g = graph_new();
@@ -12,8 +12,9 @@
 //
 // This file depends on Graph / graph_* functions from dep/graph.rs.
 // When compiled as part of the mermaid-hom crate, graph.rs is always included
-// first (via `use graph` in layout.hom).  No standalone unit tests are provided
-// here — the algorithms are exercised through tests/test_layout.hom.
+// first (via `use graph` in layout.hom).  Apart from the fas_ordering checks
+// at the end of the FAS section, the algorithms are exercised through
+// tests/test_layout.hom.
 //
 // ─── Exported types ─────────────────────────────────────────────────────────
 //
@@ -76,10 +77,8 @@
 //     gw_copy(g)                 -> Graph
 //     gw_edges_full(g)           -> EdgeInfoList
 //
-//   FAS helpers (encapsulate the set-membership scan)
-//     fas_sinks(active, out_deg) -> StrList
-//     fas_sources(active, in_deg) -> StrList
-//     fas_best_node(active, out_deg, in_deg) -> String
+//   FAS helpers
+//     fas_ordering(g)            -> StrList   (bucketed greedy FAS, O(V + E))
 //
 //   DummyEdgeList = Rc<RefCell<Vec<DummyEdgeInfo>>>
 //     (one entry per multi-layer edge that was split by insert_dummy_nodes)
@@ -405,40 +404,232 @@ pub fn gw_edges_full(g: Graph) -> EdgeInfoList {
 
 // ── FAS helpers ───────────────────────────────────────────────────────────────
 
-/// Return a StrList of all nodes in `active` whose out-degree is 0.
-pub fn fas_sinks(active: NodeSet, out_deg: DegMap) -> StrList {
-    let sinks: Vec<String> = active.inner
-        .iter()
-        .filter(|id| *out_deg.inner.get(*id).unwrap_or(&0) == 0)
-        .cloned()
-        .collect();
-    StrList { inner: sinks }
+const FAS_NONE: usize = usize::MAX;
+const FAS_SINKS: usize = 0;
+const FAS_SOURCES: usize = 1;
+
+/// Intrusive FIFO bins for the greedy FAS: node `u` sits in bin `bin[u]`,
+/// linked through `prev`/`next`, so moving it to another bin is O(1).
+struct FasBins {
+    head: Vec<usize>,
+    tail: Vec<usize>,
+    prev: Vec<usize>,
+    next: Vec<usize>,
+    bin: Vec<usize>,
+}
+
+impl FasBins {
+    fn push_back(&mut self, b: usize, u: usize) {
+        self.bin[u] = b;
+        self.prev[u] = self.tail[b];
+        self.next[u] = FAS_NONE;
+        match self.tail[b] {
+            FAS_NONE => self.head[b] = u,
+            t => self.next[t] = u,
+        }
+        self.tail[b] = u;
+    }
+
+    fn unlink(&mut self, u: usize) {
+        let b = self.bin[u];
+        let (p, n) = (self.prev[u], self.next[u]);
+        match p {
+            FAS_NONE => self.head[b] = n,
+            p => self.next[p] = n,
+        }
+        match n {
+            FAS_NONE => self.tail[b] = p,
+            n => self.prev[n] = p,
+        }
+    }
+
+    fn pop_front(&mut self, b: usize) -> Option<usize> {
+        let u = self.head[b];
+        if u == FAS_NONE {
+            return None;
+        }
+        self.unlink(u);
+        Some(u)
+    }
 }
 
-/// Return a StrList of all nodes in `active` whose in-degree is 0.
-pub fn fas_sources(active: NodeSet, in_deg: DegMap) -> StrList {
-    let sources: Vec<String> = active.inner
-        .iter()
-        .filter(|id| *in_deg.inner.get(*id).unwrap_or(&0) == 0)
-        .cloned()
-        .collect();
-    StrList { inner: sources }
-}
-
-/// Return the node in `active` with the highest (out_deg − in_deg) score.
-/// Returns "" if active is empty.
-pub fn fas_best_node(active: NodeSet, out_deg: DegMap, in_deg: DegMap) -> String {
-    let mut best_id = String::new();
-    let mut best_score = i32::MIN;
-    for node_id in active.inner.iter() {
-        let score = out_deg.inner.get(node_id).copied().unwrap_or(0)
-            - in_deg.inner.get(node_id).copied().unwrap_or(0);
-        if best_id.is_empty() || score > best_score {
-            best_score = score;
-            best_id = node_id.clone();
+/// Greedy Feedback Arc Set ordering (Eades–Lin–Smyth) in O(V + E).
+///
+/// Active nodes are kept in bins: sinks, sources, then one bin per
+/// δ = out − in. Peeling a node re-bins each active neighbour in O(1), and
+/// the max-δ cursor only moves back up when some δ rises, which is bounded
+/// by the edge count. Sinks go before sources before the max-δ node. Nodes
+/// are first binned in id order; within a bin they leave FIFO, so a node
+/// re-binned after a neighbour was peeled queues behind the nodes already
+/// there. Returns s1 ++ reversed(s2).
+pub fn fas_ordering(g: Graph) -> StrList {
+    let n = g.digraph.node_count();
+    let mut out_deg = vec![0usize; n];
+    let mut in_deg = vec![0usize; n];
+    for eidx in g.digraph.edge_indices() {
+        let (a, b) = g.digraph.edge_endpoints(eidx).unwrap();
+        out_deg[a.index()] += 1;
+        in_deg[b.index()] += 1;
+    }
+
+    // δ ranges over [-E, E]; shift it past the sink/source bins.
+    let offset = g.digraph.edge_count();
+    let bin_of = |out: usize, inn: usize| {
+        if out == 0 {
+            FAS_SINKS
+        } else if inn == 0 {
+            FAS_SOURCES
+        } else {
+            2 + offset + out - inn
+        }
+    };
+    let bin_count = 3 + 2 * offset;
+    let mut bins = FasBins {
+        head: vec![FAS_NONE; bin_count],
+        tail: vec![FAS_NONE; bin_count],
+        prev: vec![FAS_NONE; n],
+        next: vec![FAS_NONE; n],
+        bin: vec![FAS_SINKS; n],
+    };
+    let mut by_id: Vec<NodeIndex> = g.digraph.node_indices().collect();
+    by_id.sort_by(|&a, &b| g.digraph[a].id.cmp(&g.digraph[b].id));
+    for idx in &by_id {
+        let u = idx.index();
+        bins.push_back(bin_of(out_deg[u], in_deg[u]), u);
+    }
+
+    let mut active = vec![true; n];
+    let mut max_bin = bin_count - 1;
+    let mut s1: Vec<String> = Vec::new();
+    let mut s2: Vec<String> = Vec::new();
+    loop {
+        let u = if let Some(u) = bins.pop_front(FAS_SINKS) {
+            s2.push(g.digraph[NodeIndex::new(u)].id.clone());
+            u
+        } else {
+            let u = match bins.pop_front(FAS_SOURCES) {
+                Some(u) => u,
+                None => {
+                    while max_bin > FAS_SOURCES && bins.head[max_bin] == FAS_NONE {
+                        max_bin -= 1;
+                    }
+                    match bins.pop_front(max_bin) {
+                        Some(u) => u,
+                        None => break,
+                    }
+                }
+            };
+            s1.push(g.digraph[NodeIndex::new(u)].id.clone());
+            u
+        };
+        active[u] = false;
+
+        let ui = NodeIndex::new(u);
+        for v in g.digraph.neighbors(ui) {
+            let v = v.index();
+            if active[v] {
+                in_deg[v] -= 1;
+                bins.unlink(v);
+                let b = bin_of(out_deg[v], in_deg[v]);
+                bins.push_back(b, v);
+                max_bin = max_bin.max(b);
+            }
         }
+        for p in g
+            .digraph
+            .neighbors_directed(ui, petgraph::Direction::Incoming)
+        {
+            let p = p.index();
+            if active[p] {
+                out_deg[p] -= 1;
+                bins.unlink(p);
+                let b = bin_of(out_deg[p], in_deg[p]);
+                bins.push_back(b, p);
+                max_bin = max_bin.max(b);
+            }
+        }
+    }
+
+    s1.extend(s2.into_iter().rev());
+    StrList { inner: s1 }
+}
+
+// Named apart from graph.rs's `mod tests`: both files are include!d into the
+// same module.
+#[cfg(test)]
+mod tests_fas {
+    use super::*;
+
+    /// Run fas_ordering on `edges` plus any isolated `extra` nodes and check
+    /// the result. Returns the number of FAS edges: self-loops and edges that
+    /// point backward in the ordering.
+    fn check_fas(edges: &[(&str, &str)], extra: &[&str]) -> (Vec<String>, usize) {
+        let mut g = graph_new();
+        for id in extra {
+            graph_add_node(&mut g, id, id, "Rectangle", None);
+        }
+        for (a, b) in edges {
+            graph_add_edge(&mut g, a, b, "Arrow", None);
+        }
+        let order = fas_ordering(g.clone()).inner;
+
+        let mut sorted = order.clone();
+        sorted.sort();
+        let mut ids: Vec<String> = g.node_index.keys().cloned().collect();
+        ids.sort();
+        assert_eq!(sorted, ids, "ordering is not a permutation of the nodes");
+
+        let pos: HashMap<&str, usize> = order
+            .iter()
+            .enumerate()
+            .map(|(i, id)| (id.as_str(), i))
+            .collect();
+        let mut fas = 0;
+        let mut dag = graph_new();
+        for (a, b) in edges {
+            if pos[a] >= pos[b] {
+                fas += 1;
+                if a != b {
+                    graph_add_edge(&mut dag, b, a, "Arrow", None);
+                }
+            } else {
+                graph_add_edge(&mut dag, a, b, "Arrow", None);
+            }
+        }
+        assert!(graph_is_dag(&dag), "reversing the FAS edges left a cycle");
+        (order, fas)
+    }
+
+    #[test]
+    fn test_fas_chain_has_no_backward_edges() {
+        let (order, fas) = check_fas(&[("a", "b"), ("b", "c"), ("c", "d")], &[]);
+        assert_eq!(order, vec!["a", "b", "c", "d"]);
+        assert_eq!(fas, 0);
+    }
+
+    #[test]
+    fn test_fas_cycle_breaks_one_edge() {
+        let (_, fas) = check_fas(&[("a", "b"), ("b", "c"), ("c", "a")], &[]);
+        assert_eq!(fas, 1);
+    }
+
+    #[test]
+    fn test_fas_mixed_graph() {
+        // Two disjoint cycles hanging off a chain, a self-loop and an
+        // isolated node.
+        let edges = [
+            ("a", "b"),
+            ("b", "c"),
+            ("c", "a"),
+            ("c", "d"),
+            ("d", "e"),
+            ("e", "d"),
+            ("e", "f"),
+            ("f", "f"),
+        ];
+        let (_, fas) = check_fas(&edges, &["x"]);
+        assert_eq!(fas, 3);
     }
-    best_id
 }
 
 // ── DummyEdgeList ─────────────────────────────────────────────────────────────
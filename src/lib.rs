@@ -94,16 +94,36 @@ mod rust_parser {
     //! Recursive descent parser for Mermaid flowchart syntax.
     //! Produces the same types as the .hom parser module.
     use super::parser;
-
-    struct Cursor {
-        src: Vec<char>,
+    use std::borrow::Cow;
+    use std::collections::HashMap;
+
+    // Keywords and the comment marker, shared by the statement scanners.
+    // Direction names, shape brackets and arrow tokens stay next to the
+    // parsers that match them.
+    const COMMENT: &str = "%%";
+    const KW_FLOWCHART: &str = "flowchart";
+    const KW_GRAPH: &str = "graph";
+    const KW_SUBGRAPH: &str = "subgraph";
+    const KW_DIRECTION: &str = "direction";
+    const KW_END: &str = "end";
+
+    /// Byte-level scanner over the UTF-8 source.
+    ///
+    /// Every token the grammar recognises is ASCII, so the hot scanning loops
+    /// work on raw bytes and labels are sliced straight out of `text`: an
+    /// ASCII delimiter can never fall inside a multi-byte sequence, so every
+    /// position the scanner stops at is a valid `str` boundary.
+    struct Cursor<'a> {
+        text: &'a str,
+        src: &'a [u8],
         pos: usize,
     }
 
-    impl Cursor {
-        fn new(s: &str) -> Self {
+    impl<'a> Cursor<'a> {
+        fn new(s: &'a str) -> Self {
             Cursor {
-                src: s.chars().collect(),
+                text: s,
+                src: s.as_bytes(),
                 pos: 0,
             }
         }
@@ -111,36 +131,29 @@ mod rust_parser {
             self.pos >= self.src.len()
         }
         fn peek_str(&self, s: &str) -> bool {
-            let chars: Vec<char> = s.chars().collect();
-            if self.pos + chars.len() > self.src.len() {
-                return false;
-            }
-            for (i, ch) in chars.iter().enumerate() {
-                if self.src[self.pos + i] != *ch {
-                    return false;
-                }
-            }
-            true
+            self.src[self.pos..].starts_with(s.as_bytes())
         }
         fn consume_str(&mut self, s: &str) -> bool {
             if self.peek_str(s) {
-                self.pos += s.chars().count();
+                self.pos += s.len();
                 true
             } else {
                 false
             }
         }
-        fn ch(&self) -> char {
-            if self.eof() { '\0' } else { self.src[self.pos] }
+        fn ch(&self) -> u8 {
+            if self.eof() { 0 } else { self.src[self.pos] }
+        }
+        /// Source text between two scanner positions.
+        fn slice(&self, start: usize, end: usize) -> &'a str {
+            &self.text[start..end]
         }
         fn skip_ws(&mut self) {
             loop {
-                if self.pos < self.src.len() && (self.ch() == ' ' || self.ch() == '\t') {
+                if matches!(self.ch(), b' ' | b'\t') {
                     self.pos += 1;
-                } else if self.peek_str("%%") {
-                    while self.pos < self.src.len() && self.ch() != '\n' {
-                        self.pos += 1;
-                    }
+                } else if self.peek_str(COMMENT) {
+                    self.pos = self.find_from(|b| b == b'\n');
                 } else {
                     break;
                 }
@@ -148,48 +161,71 @@ mod rust_parser {
         }
         fn skip_ws_and_newlines(&mut self) {
             loop {
-                if self.pos < self.src.len() && matches!(self.ch(), ' ' | '\t' | '\n' | '\r') {
+                if matches!(self.ch(), b' ' | b'\t' | b'\n') {
                     self.pos += 1;
-                } else if self.peek_str("%%") {
-                    while self.pos < self.src.len() && self.ch() != '\n' {
-                        self.pos += 1;
-                    }
+                } else if self.peek_str(COMMENT) {
+                    self.pos = self.find_from(|b| b == b'\n');
                 } else {
                     break;
                 }
             }
         }
+        /// Line breaks are normalised to `\n` before scanning (see
+        /// parse_flowchart), so a newline is always a single byte.
         fn consume_newline(&mut self) -> bool {
-            if self.peek_str("\r\n") {
-                self.pos += 2;
-                true
-            } else if self.pos < self.src.len() && (self.ch() == '\n' || self.ch() == '\r') {
+            if self.ch() == b'\n' {
                 self.pos += 1;
                 true
             } else {
                 false
             }
         }
+        /// Index of the first byte at or after `pos` satisfying `pred`
+        /// (or end of input). Does not move the cursor.
+        fn find_from(&self, pred: impl Fn(u8) -> bool) -> usize {
+            self.src[self.pos..]
+                .iter()
+                .position(|&b| pred(b))
+                .map_or(self.src.len(), |i| self.pos + i)
+        }
+        /// Error recovery: resynchronise at the next line break, leaving the
+        /// break itself for consume_newline.
+        fn skip_line(&mut self) {
+            self.pos = self.find_from(|b| b == b'\n');
+        }
+        /// Consume a statement terminator — trailing blanks, an optional `%%`
+        /// comment and at most one line break — in a single forward scan.
+        fn eat_stmt_term(&mut self) {
+            while matches!(self.ch(), b' ' | b'\t') {
+                self.pos += 1;
+            }
+            if self.peek_str(COMMENT) {
+                self.pos = self.find_from(|b| b == b'\n');
+            }
+            self.consume_newline();
+        }
         fn match_node_id(&mut self) -> String {
             let start = self.pos;
-            if self.pos < self.src.len() && (self.ch().is_ascii_alphabetic() || self.ch() == '_') {
+            if self.ch().is_ascii_alphabetic() || self.ch() == b'_' {
                 self.pos += 1;
-                while self.pos < self.src.len()
-                    && (self.ch().is_ascii_alphanumeric() || self.ch() == '_' || self.ch() == '-')
-                {
+                while is_ident_byte(self.ch()) {
                     self.pos += 1;
                 }
                 // Backtrack trailing hyphens/dots/equals that could be edge connectors
-                while self.pos > start + 1 && matches!(self.src[self.pos - 1], '-' | '.' | '=') {
+                while self.pos > start + 1 && matches!(self.src[self.pos - 1], b'-' | b'.' | b'=') {
                     self.pos -= 1;
                 }
-                self.src[start..self.pos].iter().collect()
+                self.slice(start, self.pos).to_string()
             } else {
                 String::new()
             }
         }
     }
 
+    fn is_ident_byte(b: u8) -> bool {
+        b.is_ascii_alphanumeric() || b == b'_' || b == b'-'
+    }
+
     fn parse_direction(c: &mut Cursor) -> parser::Direction {
         if c.consume_str("TD") || c.consume_str("TB") {
             parser::Direction::TD
@@ -206,21 +242,31 @@ mod rust_parser {
 
     fn parse_quoted_string(c: &mut Cursor) -> String {
         c.pos += 1; // skip opening "
-        let mut buf = String::new();
-        while !c.eof() && c.ch() != '"' {
-            if c.ch() == '\\' && c.pos + 1 < c.src.len() {
-                let nxt = c.src[c.pos + 1];
-                match nxt {
-                    'n' => buf.push('\n'),
-                    '"' => buf.push('"'),
-                    '\\' => buf.push('\\'),
-                    other => buf.push(other),
-                }
-                c.pos += 2;
-            } else {
-                buf.push(c.ch());
-                c.pos += 1;
+        // Fast path: no escapes before the closing quote — copy the span once.
+        let start = c.pos;
+        let stop = c.find_from(|b| b == b'"' || b == b'\\');
+        if c.src.get(stop) == Some(&b'"') {
+            c.pos = stop + 1;
+            return c.slice(start, stop).to_string();
+        }
+        let mut buf = c.slice(start, stop).to_string();
+        c.pos = stop;
+        // Slow path: copy escape-free runs in bulk between escapes.
+        while c.ch() == b'\\' && c.pos + 1 < c.src.len() {
+            let nxt = c.text[c.pos + 1..].chars().next().unwrap_or('\\');
+            match nxt {
+                'n' => buf.push('\n'),
+                other => buf.push(other),
             }
+            c.pos += 1 + nxt.len_utf8();
+            let run = c.pos;
+            c.pos = c.find_from(|b| b == b'"' || b == b'\\');
+            buf.push_str(c.slice(run, c.pos));
+        }
+        if c.ch() == b'\\' {
+            // Lone trailing backslash at end of input
+            buf.push('\\');
+            c.pos += 1;
         }
         if !c.eof() {
             c.pos += 1;
@@ -228,37 +274,31 @@ mod rust_parser {
         buf
     }
 
-    fn parse_node_label(c: &mut Cursor, closers: &[char]) -> String {
+    fn parse_node_label(c: &mut Cursor, closer: u8) -> String {
         c.skip_ws();
-        if !c.eof() && c.ch() == '"' {
+        if c.ch() == b'"' {
             return parse_quoted_string(c);
         }
         let start = c.pos;
-        while !c.eof() && !closers.contains(&c.ch()) && c.ch() != '\n' {
-            c.pos += 1;
-        }
-        c.src[start..c.pos]
-            .iter()
-            .collect::<String>()
-            .trim()
-            .to_string()
+        c.pos = c.find_from(|b| b == closer || b == b'\n');
+        c.slice(start, c.pos).trim().to_string()
     }
 
     fn parse_node_shape(c: &mut Cursor) -> (bool, parser::NodeShape, String) {
         if c.consume_str("((") {
-            let label = parse_node_label(c, &[')']);
+            let label = parse_node_label(c, b')');
             c.consume_str("))");
             (true, parser::NodeShape::Circle, label)
         } else if c.consume_str("(") {
-            let label = parse_node_label(c, &[')']);
+            let label = parse_node_label(c, b')');
             c.consume_str(")");
             (true, parser::NodeShape::Rounded, label)
         } else if c.consume_str("{") {
-            let label = parse_node_label(c, &['}']);
+            let label = parse_node_label(c, b'}');
             c.consume_str("}");
             (true, parser::NodeShape::Diamond, label)
         } else if c.consume_str("[") {
-            let label = parse_node_label(c, &[']']);
+            let label = parse_node_label(c, b']');
             c.consume_str("]");
             (true, parser::NodeShape::Rectangle, label)
         } else {
@@ -266,17 +306,23 @@ mod rust_parser {
         }
     }
 
-    fn parse_node_ref(c: &mut Cursor) -> parser::Node {
+    /// A node reference as written at one use site: its id and, if a bracket
+    /// followed, the declared shape and label.
+    struct NodeRef {
+        id: String,
+        decl: Option<(parser::NodeShape, String)>,
+    }
+
+    fn parse_node_ref(c: &mut Cursor) -> NodeRef {
         c.skip_ws();
         let id = c.match_node_id();
         if id.is_empty() {
-            return parser::node_bare(String::new());
+            return NodeRef { id, decl: None };
         }
         let (found, shape, label) = parse_node_shape(c);
-        if found {
-            parser::node_new(id.clone(), label, shape)
-        } else {
-            parser::node_bare(id)
+        NodeRef {
+            id,
+            decl: found.then_some((shape, label)),
         }
     }
 
@@ -285,7 +331,10 @@ mod rust_parser {
         etype: parser::EdgeType,
     }
 
-    const EDGE_PATTERNS: &[EdgeMatch] = &[
+    // Edge tokens grouped by their leading char, longest first within each
+    // group, so a connector is resolved with one dispatch and a couple of
+    // comparisons instead of a scan over every token.
+    const EDGE_PATTERNS_LT: &[EdgeMatch] = &[
         EdgeMatch {
             token: "<-.->",
             etype: parser::EdgeType::BidirDotted,
@@ -298,14 +347,13 @@ mod rust_parser {
             token: "<-->",
             etype: parser::EdgeType::BidirArrow,
         },
+    ];
+
+    const EDGE_PATTERNS_DASH: &[EdgeMatch] = &[
         EdgeMatch {
             token: "-.->",
             etype: parser::EdgeType::DottedArrow,
         },
-        EdgeMatch {
-            token: "==>",
-            etype: parser::EdgeType::ThickArrow,
-        },
         EdgeMatch {
             token: "-->",
             etype: parser::EdgeType::Arrow,
@@ -314,19 +362,32 @@ mod rust_parser {
             token: "-.-",
             etype: parser::EdgeType::DottedLine,
         },
-        EdgeMatch {
-            token: "===",
-            etype: parser::EdgeType::ThickLine,
-        },
         EdgeMatch {
             token: "---",
             etype: parser::EdgeType::Line,
         },
     ];
 
+    const EDGE_PATTERNS_EQ: &[EdgeMatch] = &[
+        EdgeMatch {
+            token: "==>",
+            etype: parser::EdgeType::ThickArrow,
+        },
+        EdgeMatch {
+            token: "===",
+            etype: parser::EdgeType::ThickLine,
+        },
+    ];
+
     fn parse_edge_connector(c: &mut Cursor) -> parser::EdgeType {
         c.skip_ws();
-        for em in EDGE_PATTERNS {
+        let patterns = match c.ch() {
+            b'<' => EDGE_PATTERNS_LT,
+            b'-' => EDGE_PATTERNS_DASH,
+            b'=' => EDGE_PATTERNS_EQ,
+            _ => return parser::EdgeType::None,
+        };
+        for em in patterns {
             if c.consume_str(em.token) {
                 return em.etype.clone();
             }
@@ -340,51 +401,46 @@ mod rust_parser {
             return String::new();
         }
         let start = c.pos;
-        while !c.eof() && c.ch() != '|' && c.ch() != '\n' {
-            c.pos += 1;
-        }
-        let text: String = c.src[start..c.pos].iter().collect();
+        c.pos = c.find_from(|b| b == b'|' || b == b'\n');
+        let text = c.slice(start, c.pos).trim().to_string();
         c.consume_str("|");
-        text.trim().to_string()
+        text
     }
 
     fn at_end_keyword(c: &Cursor) -> bool {
-        if !c.peek_str("end") {
+        if !c.peek_str(KW_END) {
             return false;
         }
-        let after = c.pos + 3;
+        let after = c.pos + KW_END.len();
         if after >= c.src.len() {
             return true;
         }
-        let ch = c.src[after];
-        !(ch.is_ascii_alphanumeric() || ch == '_' || ch == '-')
+        !is_ident_byte(c.src[after])
     }
 
+    /// Nodes of one scope (the graph or a subgraph block) by id: index into
+    /// the scope's node list, and whether that node has a declared shape.
+    type NodeSlots = HashMap<String, (usize, bool)>;
+
+    /// Parse one edge chain or bare node statement into `nodes`/`edges`.
+    /// Subgraph blocks are handled by the caller's block stack.
     fn parse_statement_into(
         c: &mut Cursor,
         nodes: &mut Vec<parser::Node>,
+        index: &mut NodeSlots,
         edges: &mut Vec<parser::Edge>,
-        subgraphs: &mut Vec<parser::Subgraph>,
     ) -> bool {
         c.skip_ws();
         if c.eof() {
             return false;
         }
 
-        // Try subgraph
-        let saved = c.pos;
-        let sg = parse_subgraph_block(c);
-        if !sg.name.is_empty() {
-            subgraphs.push(sg);
-            return true;
-        }
-        c.pos = saved;
-
-        // Try edge statement
+        // The source node ref is parsed once and shared by the edge and
+        // bare-node branches.
         let saved = c.pos;
         let src_node = parse_node_ref(c);
         if !src_node.id.is_empty() {
-            let mut chain_segs: Vec<(parser::EdgeType, String, parser::Node)> = Vec::new();
+            let mut chain_segs: Vec<(parser::EdgeType, String, NodeRef)> = Vec::new();
             loop {
                 let seg_saved = c.pos;
                 let etype = parse_edge_connector(c);
@@ -401,142 +457,168 @@ mod rust_parser {
                 chain_segs.push((etype, lbl, tgt));
             }
 
-            if !chain_segs.is_empty() {
-                upsert_node(nodes, src_node.clone());
-                let mut prev_id = src_node.id.clone();
-                for (etype, lbl, tgt) in chain_segs {
-                    let mut e = parser::edge_new(prev_id.clone(), tgt.id.clone(), etype);
-                    e.label = lbl;
-                    upsert_node(nodes, tgt.clone());
-                    edges.push(e);
-                    prev_id = tgt.id;
-                }
-                c.skip_ws();
-                c.consume_newline();
-                return true;
+            let mut prev_id = upsert_node(nodes, index, src_node);
+            for (etype, lbl, tgt) in chain_segs {
+                let tgt_id = upsert_node(nodes, index, tgt);
+                let mut e = parser::edge_new(prev_id, tgt_id.clone(), etype);
+                e.label = lbl;
+                edges.push(e);
+                prev_id = tgt_id;
             }
-
-            // Not an edge — try as bare node
-            upsert_node(nodes, src_node);
-            c.skip_ws();
-            c.consume_newline();
+            c.eat_stmt_term();
             return true;
         }
         c.pos = saved;
         false
     }
 
-    fn upsert_node(nodes: &mut Vec<parser::Node>, node: parser::Node) {
-        if !nodes.iter().any(|n| n.id == node.id) {
-            nodes.push(node);
+    /// Record a node reference in its scope and hand back its id.
+    ///
+    /// A Node is only allocated the first time an id is seen; repeated
+    /// references are an O(1) index hit. The first declared shape wins, but a
+    /// node first seen as a bare id picks up a shape declared later
+    /// (`A --> B` then `B{Choice}`).
+    fn upsert_node(nodes: &mut Vec<parser::Node>, index: &mut NodeSlots, r: NodeRef) -> String {
+        match index.get_mut(&r.id) {
+            Some((i, declared)) => {
+                if !*declared && let Some((shape, label)) = r.decl {
+                    nodes[*i].shape = shape;
+                    nodes[*i].label = label;
+                    *declared = true;
+                }
+            }
+            None => {
+                index.insert(r.id.clone(), (nodes.len(), r.decl.is_some()));
+                nodes.push(match r.decl {
+                    Some((shape, label)) => parser::node_new(r.id.clone(), label, shape),
+                    None => parser::node_bare(r.id.clone()),
+                });
+            }
         }
+        r.id
     }
 
-    fn parse_subgraph_block(c: &mut Cursor) -> parser::Subgraph {
+    /// Parse a `subgraph <title>` line and its optional `direction` line.
+    /// Returns None, with the cursor restored, if this is not a subgraph
+    /// opener (including a `subgraph` keyword with no title).
+    fn parse_subgraph_header(c: &mut Cursor) -> Option<parser::Subgraph> {
         let saved = c.pos;
         c.skip_ws();
-        if !c.consume_str("subgraph") {
-            c.pos = saved;
-            return parser::subgraph_new(String::new());
-        }
         // "subgraph" must be followed by non-identifier char
-        if !c.eof() && (c.ch().is_ascii_alphanumeric() || c.ch() == '_' || c.ch() == '-') {
+        if !c.consume_str(KW_SUBGRAPH) || is_ident_byte(c.ch()) {
             c.pos = saved;
-            return parser::subgraph_new(String::new());
+            return None;
         }
 
         c.skip_ws();
         // Parse name/label
-        let name = if !c.eof() && c.ch() == '"' {
+        let name = if c.ch() == b'"' {
             parse_quoted_string(c)
         } else {
             let start = c.pos;
-            while !c.eof() && c.ch() != '\n' && c.ch() != '\r' {
-                c.pos += 1;
-            }
-            c.src[start..c.pos]
-                .iter()
-                .collect::<String>()
-                .trim()
-                .to_string()
+            c.pos = c.find_from(|b| b == b'\n');
+            c.slice(start, c.pos).trim().to_string()
         };
-        c.skip_ws();
-        c.consume_newline();
+        if name.is_empty() {
+            c.pos = saved;
+            return None;
+        }
+        c.eat_stmt_term();
 
         let mut sg = parser::subgraph_new(name);
 
         // Optional "direction XX"
         let dir_saved = c.pos;
         c.skip_ws();
-        if c.consume_str("direction") {
+        if c.consume_str(KW_DIRECTION) {
             c.skip_ws();
             sg.direction = parse_direction(c);
-            c.skip_ws();
-            c.consume_newline();
+            c.eat_stmt_term();
         } else {
             c.pos = dir_saved;
         }
-
-        // Parse body
-        while !c.eof() {
-            c.skip_ws();
-            if at_end_keyword(c) {
-                c.pos += 3;
-                c.skip_ws();
-                c.consume_newline();
-                break;
-            }
-            let ok = parse_statement_into(c, &mut sg.nodes, &mut sg.edges, &mut sg.subgraphs);
-            if !ok {
-                if !c.consume_newline() {
-                    c.pos += 1;
-                }
-            }
-        }
-        sg
+        Some(sg)
     }
 
     fn parse_header(c: &mut Cursor) -> parser::Direction {
         let saved = c.pos;
         c.skip_ws_and_newlines();
-        let ok = c.consume_str("flowchart") || c.consume_str("graph");
+        // Dispatch on the first character so only one keyword is ever compared.
+        let ok = match c.ch() {
+            b'f' => c.consume_str(KW_FLOWCHART),
+            b'g' => c.consume_str(KW_GRAPH),
+            _ => false,
+        };
         if !ok {
             c.pos = saved;
             return parser::Direction::TD;
         }
         c.skip_ws();
         let d = parse_direction(c);
-        c.skip_ws();
-        // skip optional trailing comment
-        if c.peek_str("%%") {
-            while !c.eof() && c.ch() != '\n' {
-                c.pos += 1;
-            }
-        }
-        c.skip_ws();
-        c.consume_newline();
+        c.eat_stmt_term();
         d
     }
 
     pub fn parse_flowchart(src: &str) -> parser::Graph {
-        let mut c = Cursor::new(src);
+        // Fold \r\n and lone \r into \n once up front, so the scanner only
+        // ever has to recognise one line-break byte.
+        let src: Cow<str> = if src.contains('\r') {
+            Cow::Owned(src.replace("\r\n", "\n").replace('\r', "\n"))
+        } else {
+            Cow::Borrowed(src)
+        };
+        let mut c = Cursor::new(&src);
         let mut g = parser::graph_new();
+        let mut g_index = NodeSlots::new();
         g.direction = parse_header(&mut c);
 
+        // Open subgraph blocks, innermost last. Statements go to the top
+        // block (or the graph itself); an explicit stack rather than
+        // recursion keeps deep nesting off the call stack.
+        let mut open: Vec<(parser::Subgraph, NodeSlots)> = Vec::new();
         while !c.eof() {
             c.skip_ws();
-            if !c.eof() {
-                if !c.consume_newline() {
-                    let ok =
-                        parse_statement_into(&mut c, &mut g.nodes, &mut g.edges, &mut g.subgraphs);
-                    if !ok {
-                        c.pos += 1;
-                    }
-                }
+            if c.eof() || c.consume_newline() {
+                continue;
+            }
+            if !open.is_empty() && at_end_keyword(&c) {
+                c.pos += KW_END.len();
+                c.eat_stmt_term();
+                let (done, _) = open.pop().unwrap();
+                close_subgraph(&mut g, &mut open, done);
+                continue;
+            }
+            if c.ch() == b's'
+                && let Some(sg) = parse_subgraph_header(&mut c)
+            {
+                open.push((sg, NodeSlots::new()));
+                continue;
             }
+            let (nodes, index, edges) = match open.last_mut() {
+                Some((sg, index)) => (&mut sg.nodes, index, &mut sg.edges),
+                None => (&mut g.nodes, &mut g_index, &mut g.edges),
+            };
+            if !parse_statement_into(&mut c, nodes, index, edges) {
+                c.skip_line();
+            }
+        }
+        // Blocks left open at end of input are closed implicitly.
+        while let Some((done, _)) = open.pop() {
+            close_subgraph(&mut g, &mut open, done);
         }
         g
     }
+
+    fn close_subgraph(
+        g: &mut parser::Graph,
+        open: &mut [(parser::Subgraph, NodeSlots)],
+        done: parser::Subgraph,
+    ) {
+        match open.last_mut() {
+            Some((parent, _)) => parent.subgraphs.push(done),
+            None => g.subgraphs.push(done),
+        }
+    }
 }
 
 // ── Bridge: parser AST → graph::Graph ───────────────────────────────────────
@@ -585,31 +667,18 @@ fn ast_to_graph(parsed: &parser::Graph) -> graph::Graph {
         );
     }
 
-    fn add_sg(g: &mut graph::Graph, sg: &parser::Subgraph) {
-        fn sh(s: &parser::NodeShape) -> &'static str {
-            match s {
-                parser::NodeShape::Rectangle => "Rectangle",
-                parser::NodeShape::Rounded => "Rounded",
-                parser::NodeShape::Diamond => "Diamond",
-                parser::NodeShape::Circle => "Circle",
-            }
-        }
-        fn et(e: &parser::EdgeType) -> &'static str {
-            match e {
-                parser::EdgeType::Arrow => "Arrow",
-                parser::EdgeType::Line => "Line",
-                parser::EdgeType::DottedArrow => "DottedArrow",
-                parser::EdgeType::DottedLine => "DottedLine",
-                parser::EdgeType::ThickArrow => "ThickArrow",
-                parser::EdgeType::ThickLine => "ThickLine",
-                parser::EdgeType::BidirArrow => "BidirArrow",
-                parser::EdgeType::BidirDotted => "BidirDotted",
-                parser::EdgeType::BidirThick => "BidirThick",
-                parser::EdgeType::None => "Arrow",
-            }
-        }
+    // Pre-order walk over nested subgraphs with an explicit stack; children
+    // are pushed in reverse so they pop in source order.
+    let mut stack: Vec<&parser::Subgraph> = parsed.subgraphs.iter().rev().collect();
+    while let Some(sg) = stack.pop() {
         for node in &sg.nodes {
-            graph::graph_add_node(g, &node.id, &node.label, sh(&node.shape), Some(&sg.name));
+            graph::graph_add_node(
+                &mut g,
+                &node.id,
+                &node.label,
+                shape_str(&node.shape),
+                Some(&sg.name),
+            );
         }
         for edge in &sg.edges {
             let label = if edge.label.is_empty() {
@@ -617,15 +686,15 @@ fn ast_to_graph(parsed: &parser::Graph) -> graph::Graph {
             } else {
                 Some(edge.label.as_str())
             };
-            graph::graph_add_edge(g, &edge.from_id, &edge.to_id, et(&edge.edge_type), label);
-        }
-        for nested in &sg.subgraphs {
-            add_sg(g, nested);
+            graph::graph_add_edge(
+                &mut g,
+                &edge.from_id,
+                &edge.to_id,
+                etype_str(&edge.edge_type),
+                label,
+            );
         }
-    }
-
-    for sg in &parsed.subgraphs {
-        add_sg(&mut g, sg);
+        stack.extend(sg.subgraphs.iter().rev());
     }
 
     g
@@ -635,48 +704,64 @@ fn ast_to_graph(parsed: &parser::Graph) -> graph::Graph {
 // All layout functions implemented in Rust to bypass broken .hom codegen
 // (nested while loops generate shadow variables instead of reassignment).
 
+use petgraph::graph::NodeIndex;
 use std::collections::{HashMap, HashSet, VecDeque};
 
 /// Phase 1: Remove cycles by reversing back edges (DFS-based).
+///
+/// Iterative DFS over node indices: roots in id order, successors in id
+/// order (each sorted once), with a per-node colour byte in place of the
+/// visited / on-stack string sets. O(V + E) after the sorts.
 fn remove_cycles_rust(g: &graph::Graph) -> (graph::Graph, Vec<(String, String)>) {
     if graph::graph_is_dag(g) {
         return (graph::graph_copy(g), vec![]);
     }
 
-    let nodes = graph::graph_nodes(g);
-    let mut visited: HashSet<String> = HashSet::new();
-    let mut on_stack: HashSet<String> = HashSet::new();
-    let mut back_edges: Vec<(String, String)> = Vec::new();
+    let id_of = |idx: NodeIndex| g.digraph[idx].id.as_str();
+    let mut roots: Vec<NodeIndex> = g.digraph.node_indices().collect();
+    roots.sort_by(|&a, &b| id_of(a).cmp(id_of(b)));
+    let succs: Vec<Vec<NodeIndex>> = g
+        .digraph
+        .node_indices()
+        .map(|idx| {
+            let mut s: Vec<NodeIndex> = g.digraph.neighbors(idx).collect();
+            s.sort_by(|&a, &b| id_of(a).cmp(id_of(b)));
+            s
+        })
+        .collect();
 
-    fn dfs(
-        node: &str,
-        g: &graph::Graph,
-        visited: &mut HashSet<String>,
-        on_stack: &mut HashSet<String>,
-        back_edges: &mut Vec<(String, String)>,
-    ) {
-        visited.insert(node.to_string());
-        on_stack.insert(node.to_string());
-        for succ in graph::graph_successors(g, node) {
-            if on_stack.contains(&succ) {
-                back_edges.push((node.to_string(), succ));
-            } else if !visited.contains(&succ) {
-                dfs(&succ, g, visited, on_stack, back_edges);
-            }
+    // 0 = unvisited, 1 = on the DFS stack, 2 = finished.
+    let mut color = vec![0u8; g.digraph.node_count()];
+    let mut back: Vec<(NodeIndex, NodeIndex)> = Vec::new();
+    let mut stack: Vec<(NodeIndex, usize)> = Vec::new();
+    for &root in &roots {
+        if color[root.index()] != 0 {
+            continue;
         }
-        on_stack.remove(node);
-    }
-
-    for node in &nodes {
-        if !visited.contains(node) {
-            dfs(node, g, &mut visited, &mut on_stack, &mut back_edges);
+        color[root.index()] = 1;
+        stack.push((root, 0));
+        while let Some((u, next)) = stack.last_mut() {
+            let u = *u;
+            let Some(&v) = succs[u.index()].get(*next) else {
+                color[u.index()] = 2;
+                stack.pop();
+                continue;
+            };
+            *next += 1;
+            match color[v.index()] {
+                0 => {
+                    color[v.index()] = 1;
+                    stack.push((v, 0));
+                }
+                1 => back.push((u, v)),
+                _ => {}
+            }
         }
     }
 
     // Build new graph with back edges reversed
     let mut dag = graph::graph_new();
-    for node in &nodes {
-        let idx = g.node_index[node];
+    for &idx in &roots {
         let nd = &g.digraph[idx];
         graph::graph_add_node(
             &mut dag,
@@ -687,52 +772,54 @@ fn remove_cycles_rust(g: &graph::Graph) -> (graph::Graph, Vec<(String, String)>)
         );
     }
 
-    let back_set: HashSet<(String, String)> = back_edges.iter().cloned().collect();
+    let back_set: HashSet<(NodeIndex, NodeIndex)> = back.iter().copied().collect();
     for eidx in g.digraph.edge_indices() {
         let (a, b) = g.digraph.edge_endpoints(eidx).unwrap();
-        let from_id = g.digraph[a].id.clone();
-        let to_id = g.digraph[b].id.clone();
         let ed = &g.digraph[eidx];
-        if back_set.contains(&(from_id.clone(), to_id.clone())) {
-            // Reverse this edge
-            graph::graph_add_edge(
-                &mut dag,
-                &to_id,
-                &from_id,
-                &ed.edge_type,
-                ed.label.as_deref(),
-            );
+        let (from, to) = if back_set.contains(&(a, b)) {
+            (b, a)
         } else {
-            graph::graph_add_edge(
-                &mut dag,
-                &from_id,
-                &to_id,
-                &ed.edge_type,
-                ed.label.as_deref(),
-            );
-        }
+            (a, b)
+        };
+        graph::graph_add_edge(
+            &mut dag,
+            id_of(from),
+            id_of(to),
+            &ed.edge_type,
+            ed.label.as_deref(),
+        );
     }
 
+    let back_edges = back
+        .into_iter()
+        .map(|(a, b)| (id_of(a).to_string(), id_of(b).to_string()))
+        .collect();
     (dag, back_edges)
 }
 
 /// Phase 2: Assign layers using longest-path method (topological order).
+///
+/// Relaxation runs over petgraph node indices into a flat layer array, so ids
+/// are hashed once per node rather than once per edge.
 fn assign_layers_rust(g: &graph::Graph) -> HashMap<String, i32> {
     let topo = graph::graph_topo_sort(g).unwrap_or_else(|| graph::graph_nodes(g));
-    let mut layers: HashMap<String, i32> = HashMap::new();
+    let mut layer = vec![0i32; g.digraph.node_count()];
     for node in &topo {
-        layers.insert(node.clone(), 0);
-    }
-    for node in &topo {
-        let curr = layers[node];
-        for succ in graph::graph_successors(g, node) {
-            let succ_layer = layers.get(&succ).copied().unwrap_or(0);
-            if succ_layer <= curr {
-                layers.insert(succ, curr + 1);
+        let idx = g.node_index[node];
+        let next = layer[idx.index()] + 1;
+        for succ in g.digraph.neighbors(idx) {
+            let l = &mut layer[succ.index()];
+            if *l < next {
+                *l = next;
             }
         }
     }
-    layers
+    topo.into_iter()
+        .map(|node| {
+            let l = layer[g.node_index[&node].index()];
+            (node, l)
+        })
+        .collect()
 }
 
 /// Phase 3-4: Build layer ordering (group nodes by layer, sort within layer).
@@ -750,6 +837,16 @@ fn build_ordering(g: &graph::Graph, layers: &HashMap<String, i32>) -> Vec<Vec<St
         group.sort();
     }
 
+    // Neighbour lists are fixed across passes; fetch (and sort) them once.
+    let preds_of: HashMap<&str, Vec<String>> = layers
+        .keys()
+        .map(|id| (id.as_str(), graph::graph_predecessors(g, id)))
+        .collect();
+    let succs_of: HashMap<&str, Vec<String>> = layers
+        .keys()
+        .map(|id| (id.as_str(), graph::graph_successors(g, id)))
+        .collect();
+
     // Barycenter crossing minimization: order by average position of neighbors
     for _pass in 0..4 {
         // Forward pass: order layer[i] by average position of predecessors in layer[i-1]
@@ -762,8 +859,7 @@ fn build_ordering(g: &graph::Graph, layers: &HashMap<String, i32>) -> Vec<Vec<St
             let mut scored: Vec<(String, f64)> = layer_groups[li]
                 .iter()
                 .map(|id| {
-                    let preds = graph::graph_predecessors(g, id);
-                    let positions: Vec<f64> = preds
+                    let positions: Vec<f64> = preds_of[id.as_str()]
                         .iter()
                         .filter_map(|p| prev_positions.get(p).copied())
                         .collect();
@@ -788,8 +884,7 @@ fn build_ordering(g: &graph::Graph, layers: &HashMap<String, i32>) -> Vec<Vec<St
             let mut scored: Vec<(String, f64)> = layer_groups[li]
                 .iter()
                 .map(|id| {
-                    let succs = graph::graph_successors(g, id);
-                    let positions: Vec<f64> = succs
+                    let positions: Vec<f64> = succs_of[id.as_str()]
                         .iter()
                         .filter_map(|s| next_positions.get(s).copied())
                         .collect();
@@ -863,14 +958,14 @@ fn assign_coordinates_rust(
     let mut y_offset = 0i32;
     for (layer_idx, layer_nodes) in ordering.iter().enumerate() {
         let mut layer_max_h = min_node_h;
-        // First pass: compute dimensions
-        let mut dims: Vec<(i32, i32)> = Vec::new();
+        // First pass: compute dimensions, keeping each node's data for the
+        // placement pass so it is looked up only once.
+        let mut dims = Vec::with_capacity(layer_nodes.len());
         for node_id in layer_nodes {
+            let nd = &g.digraph[g.node_index[node_id]];
             let (w, h) = if let Some(&(ow, oh)) = dim_overrides.get(node_id) {
                 if is_lr_or_rl { (oh, ow) } else { (ow, oh) }
             } else {
-                let idx = g.node_index[node_id];
-                let nd = &g.digraph[idx];
                 let label_w = nd.label.lines().map(|l| l.len()).max().unwrap_or(0) as i32;
                 let label_h = std::cmp::max(nd.label.lines().count() as i32, 1);
                 let w_vis = std::cmp::max(label_w + 2 + 2 * padding, 5);
@@ -886,14 +981,12 @@ fn assign_coordinates_rust(
             if h > layer_max_h {
                 layer_max_h = h;
             }
-            dims.push((w, h));
+            dims.push((w, h, nd));
         }
         // Second pass: place nodes
         let mut x_offset = 0i32;
         for (i, node_id) in layer_nodes.iter().enumerate() {
-            let (w, h) = dims[i];
-            let idx = g.node_index[node_id];
-            let nd = &g.digraph[idx];
+            let (w, h, nd) = dims[i];
             graph::nll_push(
                 nll.clone(),
                 node_id.clone(),
@@ -940,64 +1033,60 @@ fn route_edges_rust(
     reversed: &[(String, String)],
 ) -> graph::EdgeRouteList {
     let routes = graph::erl_new();
-    let nn = graph::nll_len(nodes.clone());
 
-    // Build occupancy grid
-    let mut max_x: i32 = 40;
-    let mut max_y: i32 = 10;
-    for i in 0..nn {
-        let rx = graph::nll_get_x(nodes.clone(), i) + graph::nll_get_width(nodes.clone(), i) + 10;
-        let ry = graph::nll_get_y(nodes.clone(), i) + graph::nll_get_height(nodes.clone(), i) + 10;
-        if rx > max_x {
-            max_x = rx;
-        }
-        if ry > max_y {
-            max_y = ry;
-        }
+    // Coordinate side table, read once from the layout list: every box
+    // and id lookup below is then a plain index instead of a borrow of
+    // the shared list (and a linear id scan per edge endpoint).
+    let mut boxes: Vec<(i32, i32, i32, i32)> = Vec::new();
+    let mut box_index: HashMap<String, usize> = HashMap::new();
+    for (i, n) in nodes.borrow().iter().enumerate() {
+        boxes.push((n.x, n.y, n.width, n.height));
+        box_index.entry(n.id.clone()).or_insert(i);
     }
 
+    // Build occupancy grid
+    let (max_x, max_y) = boxes.iter().fold((40, 10), |(mx, my), &(x, y, w, h)| {
+        (mx.max(x + w + 10), my.max(y + h + 10))
+    });
+
     let mut grid = pathfinder::grid_new(max_x, max_y);
-    for i in 0..nn {
-        pathfinder::grid_mark_blocked(
-            &mut grid,
-            graph::nll_get_x(nodes.clone(), i),
-            graph::nll_get_y(nodes.clone(), i),
-            graph::nll_get_width(nodes.clone(), i),
-            graph::nll_get_height(nodes.clone(), i),
-        );
+    for &(x, y, w, h) in &boxes {
+        pathfinder::grid_mark_blocked(&mut grid, x, y, w, h);
     }
 
-    // Collect all edges with metadata
-    let reversed_set: HashSet<(String, String)> = reversed.iter().cloned().collect();
+    // Collect all edges with metadata. Back edges are keyed by endpoint
+    // index pair, so the per-edge check is an integer probe rather than a
+    // clone-and-hash of both ids.
+    let reversed_set: HashSet<(usize, usize)> = reversed
+        .iter()
+        .filter_map(|(f, t)| Some((g.node_index.get(f)?.index(), g.node_index.get(t)?.index())))
+        .collect();
     for eidx in g.digraph.edge_indices() {
         let (a, b) = g.digraph.edge_endpoints(eidx).unwrap();
-        let from_id = g.digraph[a].id.clone();
-        let to_id = g.digraph[b].id.clone();
-        let ed = &g.digraph[eidx];
-        if from_id == to_id {
+        if a == b {
             continue;
         }
+        let ed = &g.digraph[eidx];
 
-        let is_rev = reversed_set.contains(&(from_id.clone(), to_id.clone()));
-        let (vis_from, vis_to) = if is_rev {
-            (to_id.clone(), from_id.clone())
+        let (vis_a, vis_b) = if reversed_set.contains(&(a.index(), b.index())) {
+            (b, a)
         } else {
-            (from_id.clone(), to_id.clone())
+            (a, b)
         };
+        let vis_from = &g.digraph[vis_a].id;
+        let vis_to = &g.digraph[vis_b].id;
 
-        let from_idx = graph::nll_id_to_index(nodes.clone(), vis_from.clone());
-        let to_idx = graph::nll_id_to_index(nodes.clone(), vis_to.clone());
-        if from_idx < 0 || to_idx < 0 {
+        let (Some(&from_idx), Some(&to_idx)) = (box_index.get(vis_from), box_index.get(vis_to))
+        else {
             continue;
-        }
+        };
+        let (fx, fy, fw, fh) = boxes[from_idx];
+        let (tx, ty, tw, _) = boxes[to_idx];
 
-        let exit_x = graph::nll_get_x(nodes.clone(), from_idx)
-            + graph::nll_get_width(nodes.clone(), from_idx) / 2;
-        let exit_y = graph::nll_get_y(nodes.clone(), from_idx)
-            + graph::nll_get_height(nodes.clone(), from_idx);
-        let entry_x = graph::nll_get_x(nodes.clone(), to_idx)
-            + graph::nll_get_width(nodes.clone(), to_idx) / 2;
-        let entry_y = graph::nll_get_y(nodes.clone(), to_idx) - 1;
+        let exit_x = fx + fw / 2;
+        let exit_y = fy + fh;
+        let entry_x = tx + tw / 2;
+        let entry_y = ty - 1;
 
         let mut path = pathfinder::a_star(&mut grid, exit_x, exit_y, entry_x, entry_y);
         let plen = graph::point_list_len(&path);
@@ -1022,8 +1111,8 @@ fn route_edges_rust(
         let label = ed.label.clone().unwrap_or_default();
         graph::erl_push(
             routes.clone(),
-            vis_from,
-            vis_to,
+            vis_from.clone(),
+            vis_to.clone(),
             label,
             ed.edge_type.clone(),
             fixed_wp,
@@ -1035,76 +1124,310 @@ fn route_edges_rust(
 
 // ── Canvas direct-mutation helpers ──────────────────────────────────────────
 // canvas.hom functions take Canvas by value (.clone()), so mutations are lost.
-// These helpers mutate c.cells directly via &mut Canvas.
+// These helpers paint into a Rust-native CharGrid via &mut.
+
+// Junction glyph for every 4-bit arm mask (up=8, down=4, left=2, right=1),
+// i.e. charset.hom's arms_to_char precomputed per charset.
+const UNICODE_JUNCTIONS: [char; 16] = [
+    ' ', '─', '─', '─', '│', '┌', '┐', '┬', '│', '└', '┘', '┴', '│', '├', '┤', '┼',
+];
+const ASCII_JUNCTIONS: [char; 16] = [
+    ' ', '-', '-', '-', '|', '+', '+', '+', '|', '+', '+', '+', '|', '+', '+', '+',
+];
+
+/// Box-drawing glyphs for one (shape, charset) pair. The char counterpart of
+/// canvas.hom's BoxChars, minus the tees/cross (see the junction tables).
+struct BoxGlyphs {
+    top_left: char,
+    top_right: char,
+    bottom_left: char,
+    bottom_right: char,
+    horizontal: char,
+    vertical: char,
+    arrow_right: char,
+    arrow_left: char,
+    arrow_down: char,
+    arrow_up: char,
+}
 
-fn cset(c: &mut canvas::Canvas, col: i32, row: i32, ch: String) {
-    if row >= 0 && row < c.height && col >= 0 && col < c.width {
-        c.cells[row as usize][col as usize] = ch;
+const UNICODE_BOX: BoxGlyphs = BoxGlyphs {
+    top_left: '┌',
+    top_right: '┐',
+    bottom_left: '└',
+    bottom_right: '┘',
+    horizontal: '─',
+    vertical: '│',
+    arrow_right: '►',
+    arrow_left: '◄',
+    arrow_down: '▼',
+    arrow_up: '▲',
+};
+const ASCII_BOX: BoxGlyphs = BoxGlyphs {
+    top_left: '+',
+    top_right: '+',
+    bottom_left: '+',
+    bottom_right: '+',
+    horizontal: '-',
+    vertical: '|',
+    arrow_right: '>',
+    arrow_left: '<',
+    arrow_down: 'v',
+    arrow_up: '^',
+};
+const UNICODE_ROUNDED: BoxGlyphs = BoxGlyphs {
+    top_left: '╭',
+    top_right: '╮',
+    bottom_left: '╰',
+    bottom_right: '╯',
+    ..UNICODE_BOX
+};
+const UNICODE_DIAMOND: BoxGlyphs = BoxGlyphs {
+    top_left: '/',
+    top_right: '\\',
+    bottom_left: '\\',
+    bottom_right: '/',
+    ..UNICODE_BOX
+};
+const ASCII_DIAMOND: BoxGlyphs = BoxGlyphs {
+    top_left: '/',
+    top_right: '\\',
+    bottom_left: '\\',
+    bottom_right: '/',
+    ..ASCII_BOX
+};
+const UNICODE_CIRCLE: BoxGlyphs = BoxGlyphs {
+    top_left: '(',
+    top_right: ')',
+    bottom_left: '(',
+    bottom_right: ')',
+    vertical: ' ',
+    ..UNICODE_BOX
+};
+const ASCII_CIRCLE: BoxGlyphs = BoxGlyphs {
+    top_left: '(',
+    top_right: ')',
+    bottom_left: '(',
+    bottom_right: ')',
+    vertical: ' ',
+    ..ASCII_BOX
+};
+
+/// Glyph set for a node shape ("Rounded", "Diamond", "Circle", anything else
+/// is a plain box). Static tables — nothing is built per node or edge.
+fn box_glyphs(shape: &str, cs: &canvas::CharSet) -> &'static BoxGlyphs {
+    let unicode = *cs == canvas::CharSet::Unicode;
+    match (shape, unicode) {
+        ("Rounded", true) => &UNICODE_ROUNDED,
+        ("Diamond", true) => &UNICODE_DIAMOND,
+        ("Diamond", false) => &ASCII_DIAMOND,
+        ("Circle", true) => &UNICODE_CIRCLE,
+        ("Circle", false) => &ASCII_CIRCLE,
+        (_, true) => &UNICODE_BOX,
+        (_, false) => &ASCII_BOX,
+    }
+}
+
+/// Arm masks for the light box-drawing block U+2500..=U+253C, indexed by
+/// code point offset; glyphs that never merge stay 0.
+const BOX_DRAWING_ARMS: [u8; 61] = {
+    let mut t = [0u8; 61];
+    t[0x00] = 0b0011; // ─
+    t[0x02] = 0b1100; // │
+    t[0x0C] = 0b0101; // ┌
+    t[0x10] = 0b0110; // ┐
+    t[0x14] = 0b1001; // └
+    t[0x18] = 0b1010; // ┘
+    t[0x1C] = 0b1101; // ├
+    t[0x24] = 0b1110; // ┤
+    t[0x2C] = 0b0111; // ┬
+    t[0x34] = 0b1011; // ┴
+    t[0x3C] = 0b1111; // ┼
+    t
+};
+
+/// Arm mask of a junction glyph (see UNICODE_JUNCTIONS); 0 when `ch` is not
+/// a mergeable box-drawing char. Table form of charset.hom's arms_from_char:
+/// one range check and a load for Unicode glyphs.
+fn arms_mask(ch: char) -> u8 {
+    match ch {
+        '\u{2500}'..='\u{253C}' => BOX_DRAWING_ARMS[ch as usize - 0x2500],
+        '-' => 0b0011,
+        '|' => 0b1100,
+        '+' => 0b1111,
+        _ => 0,
+    }
+}
+
+/// Flat, row-major character grid: one `char` per cell in a single
+/// allocation (canvas.hom's Canvas holds a heap `String` per cell).
+struct CharGrid {
+    width: i32,
+    height: i32,
+    charset: canvas::CharSet,
+    junctions: &'static [char; 16],
+    /// Plain rectangle glyphs for the charset, shared by edges and
+    /// subgraph borders; resolved once per render.
+    rect_glyphs: &'static BoxGlyphs,
+    cells: Vec<char>,
+}
+
+fn grid_new(width: i32, height: i32, charset: canvas::CharSet) -> CharGrid {
+    let (w, h) = (width.max(0), height.max(0));
+    let junctions = match charset {
+        canvas::CharSet::Unicode => &UNICODE_JUNCTIONS,
+        canvas::CharSet::Ascii => &ASCII_JUNCTIONS,
+    };
+    let rect_glyphs = box_glyphs("Rectangle", &charset);
+    CharGrid {
+        width: w,
+        height: h,
+        charset,
+        junctions,
+        rect_glyphs,
+        cells: vec![' '; (w * h) as usize],
     }
 }
 
-fn cget(c: &canvas::Canvas, col: i32, row: i32) -> String {
+/// Index of (col, row) in `cells`, or None when out of bounds.
+fn cidx(c: &CharGrid, col: i32, row: i32) -> Option<usize> {
     if row >= 0 && row < c.height && col >= 0 && col < c.width {
-        c.cells[row as usize][col as usize].clone()
+        Some((row * c.width + col) as usize)
     } else {
-        " ".to_string()
+        None
     }
 }
 
-fn cset_merge(c: &mut canvas::Canvas, col: i32, row: i32, ch: String) {
-    if row >= 0 && col >= 0 && row < c.height && col < c.width {
-        let existing = c.cells[row as usize][col as usize].clone();
-        let ea = canvas::arms_from_char(existing);
-        let na = canvas::arms_from_char(ch.clone());
-        if ea.valid && na.valid {
-            let merged = canvas::arms_merge(ea, na);
-            c.cells[row as usize][col as usize] = canvas::arms_to_char(merged, c.charset.clone());
-        } else {
-            c.cells[row as usize][col as usize] = ch;
-        }
+/// Cells of one row.
+fn crow(c: &CharGrid, row: usize) -> &[char] {
+    let w = c.width as usize;
+    &c.cells[row * w..(row + 1) * w]
+}
+
+fn cset(c: &mut CharGrid, col: i32, row: i32, ch: char) {
+    if let Some(i) = cidx(c, col, row) {
+        c.cells[i] = ch;
     }
 }
 
-fn cwrite_str(c: &mut canvas::Canvas, col: i32, row: i32, s: &str) {
-    for (i, ch) in s.chars().enumerate() {
-        let cc = col + i as i32;
-        if cc >= 0 && cc < c.width && row >= 0 && row < c.height {
-            c.cells[row as usize][cc as usize] = ch.to_string();
-        }
+fn cget(c: &CharGrid, col: i32, row: i32) -> char {
+    cidx(c, col, row).map_or(' ', |i| c.cells[i])
+}
+
+/// Merge `ch` (whose arms are `na`, from arms_mask) into an in-bounds
+/// cell; callers have already clipped. Line painters decode `na` once per
+/// line, so at most the existing cell is looked up here. Blank cells, by
+/// far the common case along an edge, are a plain store.
+fn merge_cell(junctions: &[char; 16], cell: &mut char, ch: char, na: u8) {
+    if na == 0 || *cell == ' ' {
+        *cell = ch;
+        return;
+    }
+    let ea = arms_mask(*cell);
+    *cell = if ea != 0 {
+        junctions[(ea | na) as usize]
+    } else {
+        ch
+    };
+}
+
+fn cset_merge(c: &mut CharGrid, col: i32, row: i32, ch: char) {
+    if let Some(i) = cidx(c, col, row) {
+        merge_cell(c.junctions, &mut c.cells[i], ch, arms_mask(ch));
+    }
+}
+
+/// Write `s` left to right from (col, row), clipped to the grid. The clip
+/// is computed once; chars are then copied straight into the row slice.
+fn cwrite_str(c: &mut CharGrid, col: i32, row: i32, s: &str) {
+    let start = col.max(0);
+    if row < 0 || row >= c.height || start >= c.width {
+        return;
+    }
+    let base = (row * c.width) as usize;
+    let dst = &mut c.cells[base + start as usize..base + c.width as usize];
+    let skip = (start - col) as usize;
+    for (cell, ch) in dst.iter_mut().zip(s.chars().skip(skip)) {
+        *cell = ch;
+    }
+}
+
+/// Fill columns `lo..hi` (exclusive) of `row` with `ch`, clipped to the grid.
+fn cfill_row(c: &mut CharGrid, row: i32, lo: i32, hi: i32, ch: char) {
+    let (lo, hi) = (lo.max(0), hi.min(c.width));
+    if row < 0 || row >= c.height || lo >= hi {
+        return;
+    }
+    let base = (row * c.width) as usize;
+    c.cells[base + lo as usize..base + hi as usize].fill(ch);
+}
+
+/// Fill rows `lo..hi` (exclusive) of `col` with `ch`, clipped to the grid.
+fn cfill_col(c: &mut CharGrid, col: i32, lo: i32, hi: i32, ch: char) {
+    let (lo, hi) = (lo.max(0), hi.min(c.height));
+    if col < 0 || col >= c.width || lo >= hi {
+        return;
+    }
+    let w = c.width as usize;
+    let cells = &mut c.cells[lo as usize * w + col as usize..];
+    for cell in cells.iter_mut().step_by(w).take((hi - lo) as usize) {
+        *cell = ch;
     }
 }
 
-fn cdraw_box(c: &mut canvas::Canvas, x: i32, y: i32, w: i32, h: i32, bc: &canvas::BoxChars) {
+/// Merge `ch` into columns `lo..hi` (exclusive) of `row`, clipped once.
+fn chline(c: &mut CharGrid, row: i32, lo: i32, hi: i32, ch: char) {
+    let (lo, hi) = (lo.max(0), hi.min(c.width));
+    if row < 0 || row >= c.height || lo >= hi {
+        return;
+    }
+    let base = (row * c.width) as usize;
+    let run = &mut c.cells[base + lo as usize..base + hi as usize];
+    // A run over blank space (the usual case) needs no merging at all.
+    if run.iter().all(|&cell| cell == ' ') {
+        run.fill(ch);
+        return;
+    }
+    let (junctions, na) = (c.junctions, arms_mask(ch));
+    for cell in run {
+        merge_cell(junctions, cell, ch, na);
+    }
+}
+
+/// Merge `ch` into rows `lo..hi` (exclusive) of `col`, clipped once.
+fn cvline(c: &mut CharGrid, col: i32, lo: i32, hi: i32, ch: char) {
+    let (lo, hi) = (lo.max(0), hi.min(c.height));
+    if col < 0 || col >= c.width || lo >= hi {
+        return;
+    }
+    let w = c.width as usize;
+    let (junctions, na) = (c.junctions, arms_mask(ch));
+    let cells = &mut c.cells[lo as usize * w + col as usize..];
+    for cell in cells.iter_mut().step_by(w).take((hi - lo) as usize) {
+        merge_cell(junctions, cell, ch, na);
+    }
+}
+
+fn cdraw_box(c: &mut CharGrid, x: i32, y: i32, w: i32, h: i32, bc: &BoxGlyphs) {
     if w < 2 || h < 2 {
         return;
     }
     let x1 = x + w - 1;
     let y1 = y + h - 1;
-    cset(c, x, y, bc.top_left.clone());
-    cset(c, x1, y, bc.top_right.clone());
-    cset(c, x, y1, bc.bottom_left.clone());
-    cset(c, x1, y1, bc.bottom_right.clone());
-    for col in (x + 1)..x1 {
-        cset(c, col, y, bc.horizontal.clone());
-        cset(c, col, y1, bc.horizontal.clone());
-    }
-    for row in (y + 1)..y1 {
-        cset(c, x, row, bc.vertical.clone());
-        cset(c, x1, row, bc.vertical.clone());
-    }
+    cfill_row(c, y, x + 1, x1, bc.horizontal);
+    cfill_row(c, y1, x + 1, x1, bc.horizontal);
+    cfill_col(c, x, y + 1, y1, bc.vertical);
+    cfill_col(c, x1, y + 1, y1, bc.vertical);
+    cset(c, x, y, bc.top_left);
+    cset(c, x1, y, bc.top_right);
+    cset(c, x, y1, bc.bottom_left);
+    cset(c, x1, y1, bc.bottom_right);
 }
 
 // ── Renderer helpers ────────────────────────────────────────────────────────
 
-fn paint_node(c: &mut canvas::Canvas, x: i32, y: i32, w: i32, h: i32, label: &str, shape: &str) {
-    let cs = c.charset.clone();
-    let bc = match shape {
-        "Rounded" => canvas::box_chars_rounded(cs),
-        "Diamond" => canvas::box_chars_diamond(cs),
-        "Circle" => canvas::box_chars_circle(cs),
-        _ => canvas::box_chars_for_charset(cs),
-    };
-    cdraw_box(c, x, y, w, h, &bc);
+fn paint_node(c: &mut CharGrid, x: i32, y: i32, w: i32, h: i32, label: &str, shape: &str) {
+    let bc = box_glyphs(shape, &c.charset);
+    cdraw_box(c, x, y, w, h, bc);
 
     let inner_w = std::cmp::max(0, w - 2);
     let lines: Vec<&str> = label.split('\n').collect();
@@ -1117,109 +1440,42 @@ fn paint_node(c: &mut canvas::Canvas, x: i32, y: i32, w: i32, h: i32, label: &st
     }
 }
 
-fn paint_edge(c: &mut canvas::Canvas, waypoints: &[(i32, i32)], edge_type: &str, label: &str) {
+fn paint_edge(c: &mut CharGrid, waypoints: &[(i32, i32)], edge_type: &str, label: &str) {
     if waypoints.len() < 2 {
         return;
     }
 
-    let cs = c.charset.clone();
-    let bc = canvas::box_chars_for_charset(cs.clone());
+    let (bc, junctions) = (c.rect_glyphs, c.junctions);
 
     let (h_ch, v_ch) = match edge_type {
-        "ThickArrow" | "ThickLine" | "BidirThick" => ("═".to_string(), "║".to_string()),
-        "DottedArrow" | "DottedLine" | "BidirDotted" => ("╌".to_string(), "╎".to_string()),
-        _ => (bc.horizontal.clone(), bc.vertical.clone()),
+        "ThickArrow" | "ThickLine" | "BidirThick" => ('═', '║'),
+        "DottedArrow" | "DottedLine" | "BidirDotted" => ('╌', '╎'),
+        _ => (bc.horizontal, bc.vertical),
     };
 
-    for i in 0..waypoints.len() - 1 {
-        let (x0, y0) = waypoints[i];
-        let (x1, y1) = waypoints[i + 1];
-        if y0 == y1 {
-            for col in (x0.min(x1) + 1)..x0.max(x1) {
-                cset_merge(c, col, y0, h_ch.clone());
-            }
-        } else if x0 == x1 {
-            for row in (y0.min(y1) + 1)..y0.max(y1) {
-                cset_merge(c, x0, row, v_ch.clone());
-            }
-        }
-    }
+    paint_segments(c, waypoints, h_ch, v_ch);
 
-    for i in 0..waypoints.len() {
-        let (px, py) = waypoints[i];
-        let mut arms = canvas::Arms {
-            valid: true,
-            up: false,
-            down: false,
-            left: false,
-            right: false,
-        };
-        if i > 0 {
-            let (prev_x, prev_y) = waypoints[i - 1];
-            if prev_x < px {
-                arms.left = true;
-            } else if prev_x > px {
-                arms.right = true;
-            } else if prev_y < py {
-                arms.up = true;
-            } else if prev_y > py {
-                arms.down = true;
-            }
-        }
-        if i < waypoints.len() - 1 {
-            let (nxt_x, nxt_y) = waypoints[i + 1];
-            if nxt_x > px {
-                arms.right = true;
-            } else if nxt_x < px {
-                arms.left = true;
-            } else if nxt_y > py {
-                arms.down = true;
-            } else if nxt_y < py {
-                arms.up = true;
-            }
-        }
-        cset_merge(c, px, py, canvas::arms_to_char(arms, cs.clone()));
+    // One pass over consecutive pairs: each waypoint's arms are the arm
+    // carried back from the previous segment plus the one out along the next.
+    let mut arm_in = 0;
+    for pair in waypoints.windows(2) {
+        let (p, next) = (pair[0], pair[1]);
+        let mask = arm_in | arm_toward(p, next);
+        cset_merge(c, p.0, p.1, junctions[mask as usize]);
+        arm_in = arm_toward(next, p);
     }
+    let (lx, ly) = waypoints[waypoints.len() - 1];
+    cset_merge(c, lx, ly, junctions[arm_in as usize]);
 
     // Arrowheads
-    let arrow_types = [
-        "Arrow",
-        "DottedArrow",
-        "ThickArrow",
-        "BidirArrow",
-        "BidirDotted",
-        "BidirThick",
-    ];
-    let bidir_types = ["BidirArrow", "BidirDotted", "BidirThick"];
-
-    if arrow_types.contains(&edge_type) {
-        let (last_x, last_y) = waypoints[waypoints.len() - 1];
-        let (prev_x, prev_y) = waypoints[waypoints.len() - 2];
-        let arrow = if last_y < prev_y {
-            bc.arrow_up.clone()
-        } else if last_y > prev_y {
-            bc.arrow_down.clone()
-        } else if last_x > prev_x {
-            bc.arrow_right.clone()
-        } else {
-            bc.arrow_left.clone()
-        };
-        cset(c, last_x, last_y, arrow);
-    }
-
-    if bidir_types.contains(&edge_type) && waypoints.len() >= 2 {
-        let (first_x, first_y) = waypoints[0];
-        let (second_x, second_y) = waypoints[1];
-        let arrow = if first_y < second_y {
-            bc.arrow_up.clone()
-        } else if first_y > second_y {
-            bc.arrow_down.clone()
-        } else if first_x > second_x {
-            bc.arrow_right.clone()
-        } else {
-            bc.arrow_left.clone()
-        };
-        cset(c, first_x, first_y, arrow);
+    let n = waypoints.len();
+    if is_arrow(edge_type) {
+        let (x, y) = waypoints[n - 1];
+        cset(c, x, y, arrow_glyph(bc, waypoints[n - 2], waypoints[n - 1]));
+    }
+    if is_bidir(edge_type) {
+        let (x, y) = waypoints[0];
+        cset(c, x, y, arrow_glyph(bc, waypoints[1], waypoints[0]));
     }
 
     if !label.is_empty() && waypoints.len() >= 2 {
@@ -1230,12 +1486,59 @@ fn paint_edge(c: &mut canvas::Canvas, waypoints: &[(i32, i32)], edge_type: &str,
     }
 }
 
-fn paint_exit_stubs(
-    c: &mut canvas::Canvas,
-    edges: &graph::EdgeRouteList,
-    nodes: &graph::NodeLayoutList,
-) {
-    let cs = c.charset.clone();
+fn is_arrow(edge_type: &str) -> bool {
+    matches!(
+        edge_type,
+        "Arrow" | "DottedArrow" | "ThickArrow" | "BidirArrow" | "BidirDotted" | "BidirThick"
+    )
+}
+
+fn is_bidir(edge_type: &str) -> bool {
+    matches!(edge_type, "BidirArrow" | "BidirDotted" | "BidirThick")
+}
+
+/// Arrowhead drawn at `tip` for a segment arriving from `from`.
+fn arrow_glyph(bc: &BoxGlyphs, from: (i32, i32), tip: (i32, i32)) -> char {
+    use std::cmp::Ordering;
+    match (tip.0.cmp(&from.0), tip.1.cmp(&from.1)) {
+        (_, Ordering::Less) => bc.arrow_up,
+        (_, Ordering::Greater) => bc.arrow_down,
+        (Ordering::Greater, _) => bc.arrow_right,
+        _ => bc.arrow_left,
+    }
+}
+
+/// Arm bit (up=8, down=4, left=2, right=1) pointing from `from` toward
+/// the adjacent waypoint `to`; 0 when the two coincide.
+fn arm_toward(from: (i32, i32), to: (i32, i32)) -> u8 {
+    if to.0 > from.0 {
+        0b0001
+    } else if to.0 < from.0 {
+        0b0010
+    } else if to.1 > from.1 {
+        0b0100
+    } else if to.1 < from.1 {
+        0b1000
+    } else {
+        0
+    }
+}
+
+/// Edge body kernel: paint the interior cells of every axis-aligned segment
+/// between consecutive waypoints. The waypoints themselves are painted as
+/// junctions by the caller.
+fn paint_segments(c: &mut CharGrid, waypoints: &[(i32, i32)], h_ch: char, v_ch: char) {
+    for pair in waypoints.windows(2) {
+        let ((x0, y0), (x1, y1)) = (pair[0], pair[1]);
+        if y0 == y1 {
+            chline(c, y0, x0.min(x1) + 1, x0.max(x1), h_ch);
+        } else if x0 == x1 {
+            cvline(c, x0, y0.min(y1) + 1, y0.max(y1), v_ch);
+        }
+    }
+}
+
+fn paint_exit_stubs(c: &mut CharGrid, edges: &graph::EdgeRouteList, nodes: &graph::NodeLayoutList) {
     let en = graph::erl_len(edges.clone());
 
     for ei in 0..en {
@@ -1260,38 +1563,27 @@ fn paint_exit_stubs(
         let first_wp_x = graph::erl_get_waypoint_x(edges.clone(), ei, 0);
         let first_wp_y = graph::erl_get_waypoint_y(edges.clone(), ei, 0);
 
-        let (stub_x, stub_y, arm_dir) = if first_wp_y >= ny + nh {
-            (center_x, ny + nh - 1, "down")
+        let (stub_x, stub_y, arm) = if first_wp_y >= ny + nh {
+            (center_x, ny + nh - 1, 0b0100)
         } else if first_wp_y < ny {
-            (center_x, ny, "up")
+            (center_x, ny, 0b1000)
         } else if first_wp_x >= nx + nw {
-            (nx + nw - 1, center_y, "right")
+            (nx + nw - 1, center_y, 0b0001)
         } else if first_wp_x < nx {
-            (nx, center_y, "left")
+            (nx, center_y, 0b0010)
         } else {
-            (center_x, ny + nh - 1, "down")
+            (center_x, ny + nh - 1, 0b0100)
         };
 
-        let existing = cget(c, stub_x, stub_y);
-        let ea = canvas::arms_from_char(existing);
-        if ea.valid {
-            let mut merged = ea.clone();
-            match arm_dir {
-                "down" => merged.down = true,
-                "up" => merged.up = true,
-                "right" => merged.right = true,
-                "left" => merged.left = true,
-                _ => {}
-            }
-            cset(c, stub_x, stub_y, canvas::arms_to_char(merged, cs.clone()));
+        let existing = arms_mask(cget(c, stub_x, stub_y));
+        if existing != 0 {
+            cset(c, stub_x, stub_y, c.junctions[(existing | arm) as usize]);
         }
     }
 }
 
 /// Paint exit stubs using LayoutIR primitives (no NodeLayoutList/EdgeRouteList).
-fn paint_exit_stubs_ir(c: &mut canvas::Canvas, ir: &LayoutIR) {
-    let cs = c.charset.clone();
-
+fn paint_exit_stubs_ir(c: &mut CharGrid, ir: &LayoutIR) {
     for edge in &ir.edges {
         if edge.waypoints.is_empty() {
             continue;
@@ -1300,135 +1592,155 @@ fn paint_exit_stubs_ir(c: &mut canvas::Canvas, ir: &LayoutIR) {
 
         // Find the source rect that contains/borders the first waypoint
         // (the rect whose border is closest to the first waypoint)
-        let mut best: Option<&LayoutRect> = None;
-        let mut best_dist = i32::MAX;
-        for r in &ir.rects {
+        let bordering = ir.rects.iter().filter(|r| {
             // Check if the waypoint is just outside one of the rect's borders
-            let cx = r.x + r.w / 2;
-            let cy = r.y + r.h / 2;
-            let dist = (first_wp_x - cx).abs() + (first_wp_y - cy).abs();
-            let on_border = (first_wp_y >= r.y + r.h && first_wp_y <= r.y + r.h + 1)
+            let (right, bottom) = (r.x + r.w, r.y + r.h);
+            (first_wp_y >= bottom && first_wp_y <= bottom + 1)
                 || (first_wp_y < r.y && first_wp_y >= r.y - 1)
-                || (first_wp_x >= r.x + r.w && first_wp_x <= r.x + r.w + 1)
-                || (first_wp_x < r.x && first_wp_x >= r.x - 1);
-            if on_border && dist < best_dist {
-                best_dist = dist;
-                best = Some(r);
-            }
-        }
-
-        let r = match best {
-            Some(r) => r,
-            None => continue,
+                || (first_wp_x >= right && first_wp_x <= right + 1)
+                || (first_wp_x < r.x && first_wp_x >= r.x - 1)
+        });
+        // Nearest centre wins; min_by_key keeps the first on ties.
+        let Some(r) = bordering.min_by_key(|r| {
+            (first_wp_x - (r.x + r.w / 2)).abs() + (first_wp_y - (r.y + r.h / 2)).abs()
+        }) else {
+            continue;
         };
 
+        let (right, bottom) = (r.x + r.w, r.y + r.h);
         let center_x = r.x + r.w / 2;
         let center_y = r.y + r.h / 2;
 
-        let (stub_x, stub_y, arm_dir) = if first_wp_y >= r.y + r.h {
-            (center_x, r.y + r.h - 1, "down")
+        let (stub_x, stub_y, arm) = if first_wp_y >= bottom {
+            (center_x, bottom - 1, 0b0100)
         } else if first_wp_y < r.y {
-            (center_x, r.y, "up")
-        } else if first_wp_x >= r.x + r.w {
-            (r.x + r.w - 1, center_y, "right")
+            (center_x, r.y, 0b1000)
+        } else if first_wp_x >= right {
+            (right - 1, center_y, 0b0001)
         } else if first_wp_x < r.x {
-            (r.x, center_y, "left")
+            (r.x, center_y, 0b0010)
         } else {
-            (center_x, r.y + r.h - 1, "down")
+            (center_x, bottom - 1, 0b0100)
         };
 
-        let existing = cget(c, stub_x, stub_y);
-        let ea = canvas::arms_from_char(existing);
-        if ea.valid {
-            let mut merged = ea.clone();
-            match arm_dir {
-                "down" => merged.down = true,
-                "up" => merged.up = true,
-                "right" => merged.right = true,
-                "left" => merged.left = true,
-                _ => {}
-            }
-            cset(c, stub_x, stub_y, canvas::arms_to_char(merged, cs.clone()));
+        let existing = arms_mask(cget(c, stub_x, stub_y));
+        if existing != 0 {
+            cset(c, stub_x, stub_y, c.junctions[(existing | arm) as usize]);
         }
     }
 }
 
-fn transpose_layout(nodes: &graph::NodeLayoutList, edges: &graph::EdgeRouteList) {
-    for n in nodes.borrow_mut().iter_mut() {
-        std::mem::swap(&mut n.x, &mut n.y);
-        std::mem::swap(&mut n.width, &mut n.height);
+/// Glyph as seen in a vertically mirrored drawing (BT).
+fn flip_char_vertical(c: char) -> char {
+    match c {
+        '▼' => '▲',
+        '▲' => '▼',
+        'v' => '^',
+        '^' => 'v',
+        '┌' => '└',
+        '└' => '┌',
+        '┐' => '┘',
+        '┘' => '┐',
+        '╭' => '╰',
+        '╰' => '╭',
+        '╮' => '╯',
+        '╯' => '╮',
+        '┬' => '┴',
+        '┴' => '┬',
+        other => other,
     }
-    for e in edges.borrow_mut().iter_mut() {
-        for wp in e.waypoints.iter_mut() {
-            std::mem::swap(&mut wp.0, &mut wp.1);
-        }
+}
+
+/// Glyph as seen in a horizontally mirrored drawing (RL).
+fn flip_char_horizontal(c: char) -> char {
+    match c {
+        '►' => '◄',
+        '◄' => '►',
+        '>' => '<',
+        '<' => '>',
+        '┌' => '┐',
+        '┐' => '┌',
+        '└' => '┘',
+        '┘' => '└',
+        '╭' => '╮',
+        '╮' => '╭',
+        '╰' => '╯',
+        '╯' => '╰',
+        '├' => '┤',
+        '┤' => '├',
+        other => other,
     }
 }
 
-fn flip_vertical(s: &str) -> String {
-    let remap = |c: char| -> char {
-        match c {
-            '▼' => '▲',
-            '▲' => '▼',
-            'v' => '^',
-            '^' => 'v',
-            '┌' => '└',
-            '└' => '┌',
-            '┐' => '┘',
-            '┘' => '┐',
-            '╭' => '╰',
-            '╰' => '╭',
-            '╮' => '╯',
-            '╯' => '╮',
-            '┬' => '┴',
-            '┴' => '┬',
-            other => other,
-        }
-    };
-    let lines: Vec<&str> = s.trim_end_matches('\n').split('\n').collect();
-    let flipped: Vec<String> = lines
-        .iter()
-        .rev()
-        .map(|line| line.chars().map(remap).collect::<String>())
-        .collect();
-    flipped.join("\n") + "\n"
-}
-
-fn flip_horizontal(s: &str) -> String {
-    let remap = |c: char| -> char {
-        match c {
-            '►' => '◄',
-            '◄' => '►',
-            '>' => '<',
-            '<' => '>',
-            '┌' => '┐',
-            '┐' => '┌',
-            '└' => '┘',
-            '┘' => '└',
-            '╭' => '╮',
-            '╮' => '╭',
-            '╰' => '╯',
-            '╯' => '╰',
-            '├' => '┤',
-            '┤' => '├',
-            other => other,
-        }
-    };
-    let lines: Vec<&str> = s.trim_end_matches('\n').split('\n').collect();
-    let max_w = lines.iter().map(|l| l.chars().count()).max().unwrap_or(0);
-    let flipped: Vec<String> = lines
-        .iter()
-        .map(|line| {
-            let mut chars: Vec<char> = line.chars().collect();
-            while chars.len() < max_w {
-                chars.push(' ');
-            }
-            chars.reverse();
-            let remapped: String = chars.into_iter().map(remap).collect();
-            remapped.trim_end().to_string()
+/// Grid text: each row up to its last non-space, trailing blank rows
+/// dropped (but at least `min_rows` rows kept), newline-terminated. Rows are
+/// sized first so the output is written into a single exactly-sized buffer.
+fn grid_to_string(c: &CharGrid, min_rows: usize) -> String {
+    let rows: Vec<&[char]> = (0..c.height as usize)
+        .map(|row| {
+            let cells = crow(c, row);
+            let len = cells.iter().rposition(|&ch| ch != ' ').map_or(0, |i| i + 1);
+            &cells[..len]
         })
         .collect();
-    flipped.join("\n") + "\n"
+    let used = rows
+        .iter()
+        .rposition(|r| !r.is_empty())
+        .map_or(0, |r| r + 1);
+    let rows = &rows[..used.max(min_rows).min(rows.len())];
+    let bytes: usize = rows
+        .iter()
+        .flat_map(|r| r.iter())
+        .map(|ch| ch.len_utf8())
+        .sum();
+    let mut out = String::with_capacity(bytes + rows.len() + 1);
+    for (i, row) in rows.iter().enumerate() {
+        if i > 0 {
+            out.push('\n');
+        }
+        out.extend(*row);
+    }
+    out.push('\n');
+    out
+}
+
+/// Mirror the painted grid top to bottom in place (BT) and return the number
+/// of rows mirrored. Only the rows down to the last non-blank one are
+/// mirrored; blank rows above the drawing end up below it, and the caller
+/// must keep them (as trailing empty lines) for the output to match a
+/// line-reversal of the TD text.
+fn cmirror_vertical(c: &mut CharGrid) -> usize {
+    let w = c.width as usize;
+    let used = (0..c.height as usize)
+        .rposition(|row| crow(c, row).iter().any(|&ch| ch != ' '))
+        .map_or(0, |r| r + 1);
+    let span = &mut c.cells[..used * w];
+    for top in 0..used / 2 {
+        let (upper, lower) = span.split_at_mut((used - 1 - top) * w);
+        upper[top * w..(top + 1) * w].swap_with_slice(&mut lower[..w]);
+    }
+    for cell in span {
+        *cell = flip_char_vertical(*cell);
+    }
+    used
+}
+
+/// Mirror the painted grid left to right in place (RL). Only the used
+/// width is mirrored, so the drawing stays flush with column 0.
+fn cmirror_horizontal(c: &mut CharGrid) {
+    let w = c.width as usize;
+    let used = (0..c.height as usize)
+        .filter_map(|row| crow(c, row).iter().rposition(|&ch| ch != ' '))
+        .map(|i| i + 1)
+        .max()
+        .unwrap_or(0);
+    for row in c.cells.chunks_exact_mut(w.max(1)) {
+        let span = &mut row[..used];
+        span.reverse();
+        for cell in span {
+            *cell = flip_char_horizontal(*cell);
+        }
+    }
 }
 
 // ── Compound node (subgraph collapse/expand) ───────────────────────────────
@@ -1443,6 +1755,7 @@ struct CompoundInfo {
     member_ids: Vec<String>,
     member_widths: Vec<i32>,
     member_heights: Vec<i32>,
+    content_width: i32,
     max_member_height: i32,
     member_labels: Vec<String>,
     member_shapes: Vec<String>,
@@ -1469,7 +1782,7 @@ fn collect_subgraph_members(parsed: &parser::Graph) -> Vec<(String, Vec<String>)
 /// Collapse subgraph members into compound nodes for layout.
 fn collapse_subgraphs(
     g: &graph::Graph,
-    subgraph_members: &[(String, Vec<String>)],
+    subgraph_members: Vec<(String, Vec<String>)>,
     padding: i32,
 ) -> (graph::Graph, Vec<CompoundInfo>) {
     let mut member_to_sg: HashMap<String, String> = HashMap::new();
@@ -1481,8 +1794,11 @@ fn collapse_subgraphs(
         let mut member_heights = Vec::new();
         let mut member_labels = Vec::new();
         let mut member_shapes = Vec::new();
+        // Bounding box of the member row, accumulated as members are sized.
+        let mut content_width = 0;
+        let mut max_member_height = 0;
 
-        for mid in members {
+        for mid in &members {
             if let Some(&idx) = g.node_index.get(mid.as_str()) {
                 let nd = &g.digraph[idx];
                 let max_line_w = nd.label.lines().map(|l| l.len()).max().unwrap_or(0) as i32;
@@ -1497,17 +1813,24 @@ fn collapse_subgraphs(
                 member_labels.push(mid.clone());
                 member_shapes.push("Rectangle".to_string());
             }
+            if content_width > 0 {
+                content_width += SG_INNER_GAP;
+            }
+            content_width += member_widths.last().unwrap();
+            max_member_height = max_member_height.max(*member_heights.last().unwrap());
             member_to_sg.insert(mid.clone(), sg_name.clone());
         }
-
-        let max_member_height = member_heights.iter().max().copied().unwrap_or(3);
+        if members.is_empty() {
+            max_member_height = 3;
+        }
 
         compounds.push(CompoundInfo {
-            sg_name: sg_name.clone(),
+            sg_name,
             compound_id,
-            member_ids: members.clone(),
+            member_ids: members,
             member_widths,
             member_heights,
+            content_width,
             max_member_height,
             member_labels,
             member_shapes,
@@ -1574,11 +1897,9 @@ fn collapse_subgraphs(
         if actual_src == actual_tgt {
             continue;
         }
-        let key = (actual_src.clone(), actual_tgt.clone());
-        if added_edges.contains(&key) {
+        if !added_edges.insert((actual_src.clone(), actual_tgt.clone())) {
             continue;
         }
-        added_edges.insert(key);
         graph::graph_add_edge(
             &mut collapsed,
             &actual_src,
@@ -1595,15 +1916,8 @@ fn collapse_subgraphs(
 fn compute_compound_dimensions(compounds: &[CompoundInfo]) -> HashMap<String, (i32, i32)> {
     let mut overrides = HashMap::new();
     for ci in compounds {
-        let total_member_w: i32 = ci.member_widths.iter().sum();
-        let gaps = if ci.member_ids.len() > 1 {
-            (ci.member_ids.len() as i32 - 1) * SG_INNER_GAP
-        } else {
-            0
-        };
-        let content_w = total_member_w + gaps;
         let title_w = ci.sg_name.len() as i32 + 4;
-        let inner_w = std::cmp::max(content_w, title_w);
+        let inner_w = std::cmp::max(ci.content_width, title_w);
         let width = 2 + 2 * SG_PAD_X + inner_w;
         let height = 2 + 1 + ci.max_member_height; // border top + title row + member height
         overrides.insert(ci.compound_id.clone(), (width, height));
@@ -1631,8 +1945,15 @@ fn expand_compound_nodes(
         let w = graph::nll_get_width(nodes.clone(), i);
         let h = graph::nll_get_height(nodes.clone(), i);
         let label = graph::nll_get_label(nodes.clone(), i);
-        let shape = graph::nll_get_shape(nodes.clone(), i);
         let layer = graph::nll_get_layer(nodes.clone(), i);
+        let compound = compound_map.get(&id);
+        // Compound nodes are tagged here, where they are already looked up,
+        // so the IR conversion needs no second id set.
+        let shape = if compound.is_some() {
+            "Container".to_string()
+        } else {
+            graph::nll_get_shape(nodes.clone(), i)
+        };
 
         graph::nll_push(
             result.clone(),
@@ -1647,7 +1968,7 @@ fn expand_compound_nodes(
             shape,
         );
 
-        if let Some(ci) = compound_map.get(&id) {
+        if let Some(ci) = compound {
             let mut member_x = x + 1 + SG_PAD_X;
             let member_y = y + 2; // below border + title row
             for (j, mid) in ci.member_ids.iter().enumerate() {
@@ -1672,10 +1993,8 @@ fn expand_compound_nodes(
 }
 
 /// Paint a compound (subgraph container) node: border + centered title.
-fn paint_compound_node(c: &mut canvas::Canvas, x: i32, y: i32, w: i32, h: i32, sg_name: &str) {
-    let cs = c.charset.clone();
-    let bc = canvas::box_chars_for_charset(cs);
-    cdraw_box(c, x, y, w, h, &bc);
+fn paint_compound_node(c: &mut CharGrid, x: i32, y: i32, w: i32, h: i32, sg_name: &str) {
+    cdraw_box(c, x, y, w, h, c.rect_glyphs);
 
     let inner_w = std::cmp::max(0, w - 2);
     let title_pad = std::cmp::max(0, inner_w - sg_name.len() as i32) / 2;
@@ -1684,6 +2003,19 @@ fn paint_compound_node(c: &mut canvas::Canvas, x: i32, y: i32, w: i32, h: i32, s
     cwrite_str(c, title_col, title_row, sg_name);
 }
 
+/// Canvas size for `ir`: the largest rect and waypoint extents, with a
+/// 40x10 minimum, taken in one pass over both.
+fn canvas_extent(ir: &LayoutIR) -> (i32, i32) {
+    let rects = ir.rects.iter().map(|r| (r.x + r.w + 2, r.y + r.h + 4));
+    let waypoints = ir
+        .edges
+        .iter()
+        .flat_map(|e| e.waypoints.iter().map(|&(x, y)| (x + 4, y + 4)));
+    rects
+        .chain(waypoints)
+        .fold((40, 10), |(w, h), (x, y)| (w.max(x), h.max(y)))
+}
+
 // ── Public API ──────────────────────────────────────────────────────────────
 
 /// Parse a Mermaid flowchart string and render it to ASCII/Unicode art.
@@ -1716,31 +2048,21 @@ pub fn render_dsl(
         canvas::CharSet::Ascii
     };
 
-    let mut max_col: i32 = 40;
-    let mut max_row: i32 = 10;
-    for r in &ir.rects {
-        max_col = max_col.max(r.x + r.w + 2);
-        max_row = max_row.max(r.y + r.h + 4);
-    }
-    for e in &ir.edges {
-        for &(wx, wy) in &e.waypoints {
-            max_col = max_col.max(wx + 4);
-            max_row = max_row.max(wy + 4);
-        }
-    }
-
-    let mut c = canvas::canvas_new(max_col, max_row, cs);
+    let (max_col, max_row) = canvas_extent(&ir);
+    let mut c = grid_new(max_col, max_row, cs);
 
-    // Draw containers first (behind), then nodes on top
+    // Draw containers first (behind), then nodes on top. One pass paints
+    // the containers and sets the nodes aside, so each shape is tested once.
+    let mut nodes: Vec<&LayoutRect> = Vec::with_capacity(ir.rects.len());
     for r in &ir.rects {
         if r.shape == "Container" {
             paint_compound_node(&mut c, r.x, r.y, r.w, r.h, &r.label);
+        } else {
+            nodes.push(r);
         }
     }
-    for r in &ir.rects {
-        if r.shape != "Container" {
-            paint_node(&mut c, r.x, r.y, r.w, r.h, &r.label, &r.shape);
-        }
+    for r in nodes {
+        paint_node(&mut c, r.x, r.y, r.w, r.h, &r.label, &r.shape);
     }
 
     for e in &ir.edges {
@@ -1749,28 +2071,20 @@ pub fn render_dsl(
 
     paint_exit_stubs_ir(&mut c, &ir);
 
-    // Render canvas to string (implemented directly to avoid .hom codegen issues)
-    let mut rendered = {
-        let mut lines: Vec<String> = Vec::new();
-        for row in &c.cells {
-            let line: String = row.join("");
-            lines.push(line.trim_end().to_string());
-        }
-        // Trim trailing empty lines
-        while lines.last().map(|l| l.is_empty()).unwrap_or(false) {
-            lines.pop();
+    // Direction transforms: mirror the finished drawing in place. BT keeps
+    // every mirrored row, so blank rows that sat above the drawing survive
+    // as trailing empty lines.
+    let min_rows = match direction {
+        "BT" => cmirror_vertical(&mut c),
+        "RL" => {
+            cmirror_horizontal(&mut c);
+            0
         }
-        lines.join("\n") + "\n"
+        _ => 0,
     };
 
-    // Direction transforms
-    if direction == "BT" {
-        rendered = flip_vertical(&rendered);
-    } else if direction == "RL" {
-        rendered = flip_horizontal(&rendered);
-    }
-
-    Ok(rendered)
+    // Render canvas to string (implemented directly to avoid .hom codegen issues)
+    Ok(grid_to_string(&c, min_rows))
 }
 
 /// Shared layout result used by both ASCII and SVG renderers.
@@ -1810,8 +2124,8 @@ fn run_layout_pipeline(parsed: &parser::Graph, padding: usize, direction: &str)
     let subgraph_members = collect_subgraph_members(parsed);
     let has_subgraphs = !subgraph_members.is_empty();
 
-    let (raw_nodes, raw_edges, compounds) = if has_subgraphs {
-        let (collapsed, compounds) = collapse_subgraphs(&g, &subgraph_members, padding as i32);
+    let (raw_nodes, raw_edges) = if has_subgraphs {
+        let (collapsed, compounds) = collapse_subgraphs(&g, subgraph_members, padding as i32);
         let dim_overrides = compute_compound_dimensions(&compounds);
 
         let (dag, reversed) = remove_cycles_rust(&collapsed);
@@ -1822,7 +2136,7 @@ fn run_layout_pipeline(parsed: &parser::Graph, padding: usize, direction: &str)
 
         let expanded = expand_compound_nodes(&nodes, &compounds);
         let routed = route_edges_rust(&collapsed, &expanded, &reversed);
-        (expanded, routed, compounds)
+        (expanded, routed)
     } else {
         let empty_overrides = HashMap::new();
         let (dag, reversed) = remove_cycles_rust(&g);
@@ -1836,59 +2150,48 @@ fn run_layout_pipeline(parsed: &parser::Graph, padding: usize, direction: &str)
             &empty_overrides,
         );
         let routed = route_edges_rust(&g, &nodes, &reversed);
-        (nodes, routed, Vec::new())
+        (nodes, routed)
     };
 
-    if is_lr_or_rl {
-        transpose_layout(&raw_nodes, &raw_edges);
-    }
-
-    // Convert to flat primitives
-    let compound_ids: HashSet<String> = compounds.iter().map(|c| c.compound_id.clone()).collect();
-    let mut rects = Vec::new();
-    let nn = graph::nll_len(raw_nodes.clone());
-    for i in 0..nn {
-        let id = graph::nll_get_id(raw_nodes.clone(), i);
-        if id.starts_with("__dummy_") {
-            continue;
-        }
-        let x = graph::nll_get_x(raw_nodes.clone(), i);
-        let y = graph::nll_get_y(raw_nodes.clone(), i);
-        let w = graph::nll_get_width(raw_nodes.clone(), i);
-        let h = graph::nll_get_height(raw_nodes.clone(), i);
-        let label = graph::nll_get_label(raw_nodes.clone(), i);
-        let shape = if compound_ids.contains(&id) {
-            "Container".to_string()
-        } else {
-            graph::nll_get_shape(raw_nodes.clone(), i)
-        };
-        rects.push(LayoutRect {
-            x,
-            y,
-            w,
-            h,
-            label,
-            shape,
-        });
-    }
+    // Convert to flat primitives. The layout lists are drained rather than
+    // copied field by field, and LR/RL is transposed on the way out, so
+    // no second pass over the nodes and waypoints is needed.
+    let rects: Vec<LayoutRect> = std::mem::take(&mut *raw_nodes.borrow_mut())
+        .into_iter()
+        .filter(|n| !n.id.starts_with("__dummy_"))
+        .map(|n| {
+            let (x, y, w, h) = if is_lr_or_rl {
+                (n.y, n.x, n.height, n.width)
+            } else {
+                (n.x, n.y, n.width, n.height)
+            };
+            LayoutRect {
+                x,
+                y,
+                w,
+                h,
+                label: n.label,
+                shape: n.shape,
+            }
+        })
+        .collect();
 
-    let en = graph::erl_len(raw_edges.clone());
-    let mut edges = Vec::new();
-    for i in 0..en {
-        let wpc = graph::erl_get_waypoint_count(raw_edges.clone(), i);
-        let mut waypoints = Vec::new();
-        for j in 0..wpc {
-            waypoints.push((
-                graph::erl_get_waypoint_x(raw_edges.clone(), i, j),
-                graph::erl_get_waypoint_y(raw_edges.clone(), i, j),
-            ));
-        }
-        edges.push(LayoutEdge {
-            waypoints,
-            edge_type: graph::erl_get_etype(raw_edges.clone(), i),
-            label: graph::erl_get_label(raw_edges.clone(), i),
-        });
-    }
+    let edges: Vec<LayoutEdge> = std::mem::take(&mut *raw_edges.borrow_mut())
+        .into_iter()
+        .map(|e| {
+            let mut waypoints = e.waypoints;
+            if is_lr_or_rl {
+                for wp in waypoints.iter_mut() {
+                    *wp = (wp.1, wp.0);
+                }
+            }
+            LayoutEdge {
+                waypoints,
+                edge_type: e.edge_type,
+                label: e.label,
+            }
+        })
+        .collect();
 
     LayoutIR { rects, edges }
 }
@@ -1920,6 +2223,38 @@ pub fn render_svg_dsl(
     Ok(svg_renderer::render_ir(&ir, direction))
 }
 
+/// Render several independent diagrams with the same options.
+///
+/// Each source is parsed, laid out and painted on its own worker thread
+/// (no state is shared between renders). Small batches, and targets without
+/// threads, render sequentially. Results are returned in input order.
+pub fn render_many(
+    sources: &[&str],
+    unicode: bool,
+    padding: usize,
+    direction: Option<&str>,
+) -> Vec<Result<String, String>> {
+    let render_one = |src: &&str| render_dsl(src, unicode, padding, direction);
+    if sources.len() < 4 || cfg!(target_arch = "wasm32") {
+        return sources.iter().map(render_one).collect();
+    }
+
+    let workers = std::thread::available_parallelism()
+        .map_or(1, |n| n.get())
+        .min(sources.len());
+    let chunk_size = sources.len().div_ceil(workers);
+    std::thread::scope(|scope| {
+        let handles: Vec<_> = sources
+            .chunks(chunk_size)
+            .map(|chunk| scope.spawn(move || chunk.iter().map(render_one).collect::<Vec<_>>()))
+            .collect();
+        handles
+            .into_iter()
+            .flat_map(|h| h.join().expect("render worker panicked"))
+            .collect()
+    })
+}
+
 // ── WASM bindings ───────────────────────────────────────────────────────────
 
 #[cfg(feature = "wasm")]
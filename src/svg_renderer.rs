@@ -16,12 +16,30 @@ const PADDING: i32 = 20;
 const FILL_STROKE: &str = r#"fill="white" stroke="black" stroke-width="1.5""#;
 const SG_STROKE: &str = r##"fill="none" stroke="#888" stroke-width="1" stroke-dasharray="4 2""##;
 
+/// Arrowhead marker definitions, emitted verbatim after the opening tag.
+const SVG_DEFS: &str = r#"<defs>
+  <marker id="arrowhead" markerWidth="10" markerHeight="7" refX="10" refY="3.5" orient="auto">
+    <polygon points="0 0, 10 3.5, 0 7" fill="black"/>
+  </marker>
+  <marker id="arrowhead-rev" markerWidth="10" markerHeight="7" refX="0" refY="3.5" orient="auto">
+    <polygon points="10 0, 0 3.5, 10 7" fill="black"/>
+  </marker>
+</defs>
+"#;
+
 // ── Helpers ──────────────────────────────────────────────────────────────────
 
 fn escape(s: &str) -> String {
-    s.replace('&', "&amp;")
-        .replace('<', "&lt;")
-        .replace('>', "&gt;")
+    let mut out = String::with_capacity(s.len());
+    for ch in s.chars() {
+        match ch {
+            '&' => out.push_str("&amp;"),
+            '<' => out.push_str("&lt;"),
+            '>' => out.push_str("&gt;"),
+            _ => out.push(ch),
+        }
+    }
+    out
 }
 
 fn font(size: i32) -> String {
@@ -179,6 +197,19 @@ fn render_edge(e: &LayoutEdge) -> String {
     parts.join("\n")
 }
 
+/// Canvas size in cells from IR primitives, in one pass over rects and
+/// waypoints.
+fn grid_extent(ir: &LayoutIR) -> (i32, i32) {
+    let rects = ir.rects.iter().map(|r| (r.x + r.w + 2, r.y + r.h + 2));
+    let waypoints = ir
+        .edges
+        .iter()
+        .flat_map(|e| e.waypoints.iter().map(|&(x, y)| (x + 2, y + 2)));
+    rects
+        .chain(waypoints)
+        .fold((0, 0), |(w, h), (x, y)| (w.max(x), h.max(y)))
+}
+
 // ── Public API ───────────────────────────────────────────────────────────────
 
 /// 1:1 render LayoutIR → SVG string. No layout logic, just drawing.
@@ -187,19 +218,7 @@ pub fn render_ir(ir: &LayoutIR, direction: &str) -> String {
         return String::new();
     }
 
-    // Compute canvas size from IR primitives
-    let mut max_col: i32 = 0;
-    let mut max_row: i32 = 0;
-    for r in &ir.rects {
-        max_col = max_col.max(r.x + r.w + 2);
-        max_row = max_row.max(r.y + r.h + 2);
-    }
-    for e in &ir.edges {
-        for &(wx, wy) in &e.waypoints {
-            max_col = max_col.max(wx + 2);
-            max_row = max_row.max(wy + 2);
-        }
-    }
+    let (max_col, max_row) = grid_extent(ir);
 
     let svg_w = PADDING * 2 + max_col * CELL_W;
     let svg_h = PADDING * 2 + max_row * CELL_H;
@@ -210,29 +229,32 @@ pub fn render_ir(ir: &LayoutIR, direction: &str) -> String {
         _ => String::new(),
     };
 
-    let mut parts = vec![
-        format!(
-            r#"<svg xmlns="http://www.w3.org/2000/svg" width="{svg_w}" height="{svg_h}" viewBox="0 0 {svg_w} {svg_h}">"#
-        ),
-        "<defs>".to_string(),
-        r#"  <marker id="arrowhead" markerWidth="10" markerHeight="7" refX="10" refY="3.5" orient="auto">"#.to_string(),
-        r#"    <polygon points="0 0, 10 3.5, 0 7" fill="black"/>"#.to_string(),
-        "  </marker>".to_string(),
-        r#"  <marker id="arrowhead-rev" markerWidth="10" markerHeight="7" refX="0" refY="3.5" orient="auto">"#.to_string(),
-        r#"    <polygon points="10 0, 0 3.5, 10 7" fill="black"/>"#.to_string(),
-        "  </marker>".to_string(),
-        "</defs>".to_string(),
-        format!(r#"<rect width="{svg_w}" height="{svg_h}" fill="white"/>"#),
-    ];
+    // Everything is appended to one buffer, one element per line.
+    let mut out = format!(
+        r#"<svg xmlns="http://www.w3.org/2000/svg" width="{svg_w}" height="{svg_h}" viewBox="0 0 {svg_w} {svg_h}">"#
+    );
+    out.push('\n');
+    out.push_str(SVG_DEFS);
+    out.push_str(&format!(
+        r#"<rect width="{svg_w}" height="{svg_h}" fill="white"/>"#
+    ));
+    let mut push = |part: &str| {
+        out.push('\n');
+        out.push_str(part);
+    };
 
     if !transform.is_empty() {
-        parts.push(transform);
+        push(&transform);
     }
 
-    // Draw containers first (behind everything)
+    // Draw containers first (behind everything); nodes are set aside in
+    // the same pass for drawing after the edges.
+    let mut nodes: Vec<&LayoutRect> = Vec::with_capacity(ir.rects.len());
     for r in &ir.rects {
         if r.shape == "Container" {
-            parts.push(render_rect(r));
+            push(&render_rect(r));
+        } else {
+            nodes.push(r);
         }
     }
 
@@ -240,21 +262,19 @@ pub fn render_ir(ir: &LayoutIR, direction: &str) -> String {
     for e in &ir.edges {
         let svg = render_edge(e);
         if !svg.is_empty() {
-            parts.push(svg);
+            push(&svg);
         }
     }
 
     // Draw nodes on top
-    for r in &ir.rects {
-        if r.shape != "Container" {
-            parts.push(render_rect(r));
-        }
+    for r in nodes {
+        push(&render_rect(r));
     }
 
     if direction == "BT" || direction == "RL" {
-        parts.push("</g>".to_string());
+        push("</g>");
     }
 
-    parts.push("</svg>".to_string());
-    parts.join("\n")
+    push("</svg>");
+    out
 }
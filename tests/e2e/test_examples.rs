@@ -1,39 +1,58 @@
 //! Integration test: run ALL _site/examples/*.mm.md through the full pipeline
 //! and compare output against .expect.txt and .expect.svg golden files.
 
-use mermaid_ascii::{render_dsl, render_svg_dsl};
+use mermaid_ascii::{render_dsl, render_many, render_svg_dsl};
 use std::fs;
 use std::path::Path;
+use std::sync::OnceLock;
+
+/// One example source plus whichever golden files exist for it.
+struct Example {
+    name: String,
+    source: String,
+    expect_txt: Option<String>,
+    expect_svg: Option<String>,
+}
+
+/// All examples, read from disk once and shared by every test in this file.
+fn examples() -> &'static [Example] {
+    static EXAMPLES: OnceLock<Vec<Example>> = OnceLock::new();
+    EXAMPLES.get_or_init(|| {
+        let examples_dir = Path::new("_site/examples");
+        let mut examples = Vec::new();
+        for entry in fs::read_dir(examples_dir).expect("_site/examples/ dir must exist") {
+            let path = entry.unwrap().path();
+            let file_name = path.file_name().unwrap().to_string_lossy();
+            let Some(base) = file_name.strip_suffix(".mm.md") else {
+                continue;
+            };
+            let golden = |ext: &str| {
+                fs::read_to_string(examples_dir.join(format!("{}.expect.{}", base, ext))).ok()
+            };
+            examples.push(Example {
+                name: base.to_string(),
+                source: fs::read_to_string(&path).unwrap(),
+                expect_txt: golden("txt"),
+                expect_svg: golden("svg"),
+            });
+        }
+        examples
+    })
+}
 
 #[test]
 fn test_all_examples_txt() {
-    let examples_dir = Path::new("_site/examples");
     let mut tested = 0;
     let mut failures = Vec::new();
 
-    for entry in fs::read_dir(examples_dir).expect("_site/examples/ dir must exist") {
-        let entry = entry.unwrap();
-        let path = entry.path();
-        if path.extension().map_or(true, |e| e != "md") {
-            continue;
-        }
-        let name = path.file_stem().unwrap().to_string_lossy();
-        if !name.ends_with(".mm") {
-            continue;
-        }
-        let base = name.strip_suffix(".mm").unwrap();
-
-        let expect_path = examples_dir.join(format!("{}.expect.txt", base));
-        if !expect_path.exists() {
+    for ex in examples() {
+        let Some(expected) = &ex.expect_txt else {
             continue;
-        }
-
-        let input = fs::read_to_string(&path).unwrap();
-        let expected = fs::read_to_string(&expect_path).unwrap();
-        let result = render_dsl(&input, true, 1, None).unwrap();
+        };
+        let result = render_dsl(&ex.source, true, 1, None).unwrap();
 
         if result.trim() != expected.trim() {
-            failures.push(base.to_string());
+            failures.push(ex.name.clone());
         }
         tested += 1;
     }
@@ -48,30 +67,79 @@ fn test_all_examples_txt() {
 
 #[test]
 fn test_all_examples_svg() {
-    let examples_dir = Path::new("_site/examples");
     let mut tested = 0;
     let mut failures = Vec::new();
 
-    for entry in fs::read_dir(examples_dir).expect("_site/examples/ dir must exist") {
-        let entry = entry.unwrap();
-        let path = entry.path();
-        if path.extension().map_or(true, |e| e != "md") {
-            continue;
-        }
-        let name = path.file_stem().unwrap().to_string_lossy();
-        if !name.ends_with(".mm") {
+    for ex in examples() {
+        let Some(expected) = &ex.expect_svg else {
             continue;
+        };
+        let result = render_svg_dsl(&ex.source, 1, None).unwrap();
+
+        if result.trim() != expected.trim() {
+            failures.push(ex.name.clone());
         }
-        let base = name.strip_suffix(".mm").unwrap();
+        tested += 1;
+    }
+
+    assert!(tested > 0, "no examples found to test");
+    assert!(
+        failures.is_empty(),
+        "svg output mismatch for: {}",
+        failures.join(", ")
+    );
+}
+
+#[test]
+fn test_render_many_matches_render_dsl() {
+    let sources: Vec<&str> = examples().iter().map(|ex| ex.source.as_str()).collect();
+    assert!(
+        sources.len() >= 4,
+        "need enough examples to exercise the parallel path"
+    );
 
-        let expect_path = examples_dir.join(format!("{}.expect.svg", base));
-        if !expect_path.exists() {
+    let batch = render_many(&sources, true, 1, None);
+    assert_eq!(batch.len(), sources.len());
+    for (src, result) in sources.iter().zip(batch) {
+        assert_eq!(result, render_dsl(src, true, 1, None));
+    }
+}
+
+#[test]
+fn test_bt_keeps_blank_rows_above_the_drawing() {
+    // A self-loop routes above its node, so the TD drawing starts with blank
+    // rows; mirrored for BT they must survive as trailing empty lines.
+    let src = "flowchart TD\n A[Lbl A] ==> A\n";
+    let td = render_dsl(src, true, 1, None).unwrap();
+    let bt = render_dsl(src, true, 1, Some("BT")).unwrap();
+    assert!(td.starts_with('\n'));
+    assert_eq!(bt.lines().count(), td.lines().count());
+    let td_rev: Vec<&str> = td.lines().rev().collect();
+    let bt_lines: Vec<&str> = bt.lines().collect();
+    for (b, t) in bt_lines.iter().zip(&td_rev) {
+        assert_eq!(b.is_empty(), t.is_empty());
+    }
+}
+
+#[test]
+fn test_edge_cases_txt() {
+    let dir = Path::new("_site/examples/edge_cases");
+    let mut tested = 0;
+    let mut failures = Vec::new();
+
+    for entry in fs::read_dir(dir).expect("_site/examples/edge_cases/ dir must exist") {
+        let path = entry.unwrap().path();
+        let file_name = path.file_name().unwrap().to_string_lossy();
+        let Some(base) = file_name.strip_suffix(".txt") else {
+            continue;
+        };
+        if base.ends_with(".expect") {
             continue;
         }
-
-        let input = fs::read_to_string(&path).unwrap();
-        let expected = fs::read_to_string(&expect_path).unwrap();
-        let result = render_svg_dsl(&input, 1, None).unwrap();
+        let source = fs::read_to_string(&path).unwrap();
+        let expected = fs::read_to_string(dir.join(format!("{}.expect.txt", base)))
+            .unwrap_or_else(|_| panic!("missing golden for edge case {}", base));
+        let result = render_dsl(&source, true, 1, None).unwrap();
 
         if result.trim() != expected.trim() {
             failures.push(base.to_string());
@@ -79,10 +147,64 @@ fn test_all_examples_svg() {
         tested += 1;
     }
 
-    assert!(tested > 0, "no examples found to test");
+    assert!(tested > 0, "no edge cases found to test");
     assert!(
         failures.is_empty(),
-        "svg output mismatch for: {}",
+        "edge case output mismatch for: {}",
         failures.join(", ")
     );
 }
+
+#[test]
+fn test_parse_error_skips_rest_of_line() {
+    // Garbage after a statement drops the rest of that line, and a line
+    // that is garbage from the start contributes nothing; parsing resumes
+    // on the next line either way.
+    let src = "graph TD\n A --> B ]]] C\n@@@ X\n D --> E\n";
+    let out = render_dsl(src, true, 1, None).unwrap();
+    for id in ["A", "B", "D", "E"] {
+        assert!(out.contains(&format!("│ {} │", id)), "missing {}", id);
+    }
+    assert!(!out.contains("│ C │"));
+    assert!(!out.contains("│ X │"));
+}
+
+#[test]
+fn test_bare_id_takes_shape_declared_later() {
+    // `B` is first seen as a bare id; the later `B{Choice}` declaration
+    // gives it a diamond shape and label.
+    let src = "graph TD\n A --> B\n B{Choice}\n";
+    let out = render_dsl(src, true, 1, None).unwrap();
+    assert!(out.contains("│ Choice │"));
+    assert!(out.contains('/') && out.contains('\\'));
+    assert!(!out.contains("│ B │"));
+
+    // Once a node has a declared shape, later declarations do not replace it.
+    let src = "graph TD\n A[One] --> B\n A(Two)\n";
+    let out = render_dsl(src, true, 1, None).unwrap();
+    assert!(out.contains("│ One │"));
+    assert!(!out.contains("Two"));
+}
+
+#[test]
+fn test_crlf_and_cr_line_endings_match_lf() {
+    let lf = "graph LR\n A[Start] --> B{Ok?}\n B -->|yes| C((Done))\n";
+    let expect_txt = render_dsl(lf, true, 1, None).unwrap();
+    let expect_svg = render_svg_dsl(lf, 1, None).unwrap();
+    for newline in ["\r\n", "\r"] {
+        let src = lf.replace('\n', newline);
+        assert_eq!(render_dsl(&src, true, 1, None).unwrap(), expect_txt);
+        assert_eq!(render_svg_dsl(&src, 1, None).unwrap(), expect_svg);
+    }
+}
+
+#[test]
+fn test_untitled_subgraph_keeps_its_statements() {
+    // A `subgraph` keyword without a title does not open a block; the lines
+    // after it are still parsed as ordinary statements.
+    for header in ["subgraph", "subgraph \"\""] {
+        let src = format!("graph TD\n{}\n A --> B\nend\n", header);
+        let out = render_dsl(&src, true, 1, None).unwrap();
+        assert!(out.contains("│ A │") && out.contains("│ B │"), "{}", header);
+    }
+}